@@ -0,0 +1,138 @@
+import random
+import struct
+
+from typing import Any, Dict, List, NamedTuple
+
+AP_SETTINGS_RAM_BASE = 0x80003000
+
+
+class SettingField(NamedTuple):
+    offset: int
+    format: str
+    key: str
+    default: Any
+
+
+# Layout of the APSettings block in main.dol, read by the mod at RAM AP_SETTINGS_RAM_BASE + offset.
+# Keys are options.json keys, apart from the handful derived in settings_values.
+# Bytes not covered here (0x228, 0x23B, 0x23F, 0x240, ...) belong to the mod at runtime and are left as they are,
+# as are the bytes of a string field past the end of its value.
+AP_SETTINGS_LAYOUT = (
+    SettingField(0x1FF, "B", "player_name_length", 0),
+    SettingField(0x200, "16s", "player_name", b""),
+    SettingField(0x210, "16s", "seed_name", b""),
+    SettingField(0x220, "B", "palace_stars", 7),
+    SettingField(0x221, "B", "starting_partner", 1),
+    SettingField(0x222, "B", "yoshi_color", 0),
+    SettingField(0x223, "B", "ap_enabled", 1),
+    SettingField(0x224, "I", "yoshi_name_address", 0x80003260),
+    SettingField(0x229, "B", "palace_skip", 0),
+    SettingField(0x22A, "B", "westside", 0),
+    SettingField(0x22B, "B", "peekaboo", 0),
+    SettingField(0x22C, "B", "intermissions", 0),
+    SettingField(0x22D, "B", "starting_hp", 10),
+    SettingField(0x22E, "B", "starting_fp", 5),
+    SettingField(0x22F, "B", "starting_bp", 3),
+    SettingField(0x230, "B", "full_run_bar", 0),
+    SettingField(0x231, "7s", "required_chapters", b""),
+    SettingField(0x238, "B", "tattlesanity", 0),
+    SettingField(0x239, "B", "fast_travel", 0),
+    SettingField(0x23A, "B", "succeed_conditions", 0),
+    SettingField(0x23C, "B", "cutscene_skip", 0),
+    SettingField(0x23D, "B", "experience_multiplier", 1),
+    SettingField(0x23E, "B", "starting_level", 1),
+    SettingField(0x241, "B", "music", 0),
+    SettingField(0x242, "B", "block_visibility", 1),
+    SettingField(0x243, "B", "first_attack", 0),
+    SettingField(0x244, "4s", "random_bytes", b""),
+    SettingField(0x248, "B", "goal_stars", 7),
+    SettingField(0x249, "B", "goal", 1),
+    SettingField(0x24A, "B", "star_shuffle", 1),
+    SettingField(0x24B, "B", "dazzle_rewards", 3),
+    SettingField(0x24C, "B", "console_mode", 0),
+    SettingField(0x24D, "B", "shop_purchase_limit", 1),
+    SettingField(0x24E, "B", "grubba_bribe_direction", 2),
+    SettingField(0x24F, "B", "grubba_bribe_cost", 20),
+    SettingField(0x250, "B", "blue_pipe_toggle", 1),
+    SettingField(0x251, "B", "enemy_randomizer", 0),
+    SettingField(0x252, "B", "enemy_stat_scaling", 0),
+    SettingField(0x253, "B", "shuffle_chapter_stats", 0),
+    SettingField(0x258, "B", "badge_bp", 0),
+    SettingField(0x259, "B", "badge_fp", 0),
+    SettingField(0x25A, "B", "partner_fp", 0),
+    SettingField(0x260, "9s", "yoshi_name", b"Yoshi\x00"),
+)
+
+AP_SETTINGS_START = AP_SETTINGS_LAYOUT[0].offset
+
+
+def _build_layout():
+    # One struct for the whole block; gaps become plain byte strings that are carried over unchanged.
+    fmt = ">"
+    items = []
+    cursor = AP_SETTINGS_START
+    for field in sorted(AP_SETTINGS_LAYOUT):
+        if field.offset < cursor:
+            raise Exception(f"APSettings field {field.key} overlaps the previous field")
+        if field.offset > cursor:
+            fmt += f"{field.offset - cursor}s"
+            items.append(None)
+        fmt += field.format
+        items.append(field)
+        cursor = field.offset + struct.calcsize(">" + field.format)
+    return struct.Struct(fmt), items
+
+
+_LAYOUT_STRUCT, _LAYOUT_ITEMS = _build_layout()
+AP_SETTINGS_SIZE = _LAYOUT_STRUCT.size
+
+
+def settings_values(seed_options: Dict[str, Any]) -> Dict[str, Any]:
+    """The options.json values with the derived fields of the block filled in."""
+    name_length = min(len(seed_options["player_name"]), 0x10)
+    values = dict(seed_options)
+    values["player_name_length"] = name_length
+    values["player_name"] = seed_options["player_name"].encode("utf-8")[0:name_length]
+    values["seed_name"] = seed_options["seed_name"].encode("utf-8")[0:16]
+    values["required_chapters"] = bytes(seed_options.get("required_chapters", []))
+    values["console_mode"] = 1 if seed_options.get("console_mode", 0) else 0
+    values["random_bytes"] = random.Random(seed_options["seed"] + seed_options["player"]).randbytes(4)
+    values["yoshi_name"] = seed_options.get("yoshi_name", "Yoshi").encode("utf-8")[0:8] + b"\x00"
+    return values
+
+
+def _packed_value(value: Any, current: Any) -> Any:
+    # Byte string fields only cover as much of the field as their value does, like the per-field writes
+    # patch_mod used to do; the rest of the field keeps the bytes already in the DOL.
+    if isinstance(value, bytes):
+        return value + current[len(value):]
+    return value
+
+
+def pack_ap_settings(buffer, seed_options: Dict[str, Any], offset: int = AP_SETTINGS_START) -> None:
+    """Writes the whole block into a writable buffer (e.g. the DOL's getbuffer()) with one pack_into."""
+    values = settings_values(seed_options)
+    current = _LAYOUT_STRUCT.unpack_from(buffer, offset)
+    _LAYOUT_STRUCT.pack_into(buffer, offset, *[
+        current[i] if field is None else _packed_value(values.get(field.key, field.default), current[i])
+        for i, field in enumerate(_LAYOUT_ITEMS)
+    ])
+
+
+def read_ap_settings(block: bytes) -> Dict[str, Any]:
+    """Decodes a block read from the DOL or from RAM at AP_SETTINGS_RAM_BASE + AP_SETTINGS_START."""
+    return {field.key: value for field, value in zip(_LAYOUT_ITEMS, _LAYOUT_STRUCT.unpack_from(block))
+            if field is not None}
+
+
+def validate_ap_settings(block: bytes, seed_options: Dict[str, Any]) -> List[str]:
+    """Keys of the fields in block that differ from what pack_ap_settings would write for seed_options."""
+    expected = bytearray(block[:AP_SETTINGS_SIZE])
+    pack_ap_settings(expected, seed_options, 0)
+    mismatched = []
+    for field in AP_SETTINGS_LAYOUT:
+        start = field.offset - AP_SETTINGS_START
+        end = start + struct.calcsize(">" + field.format)
+        if block[start:end] != expected[start:end]:
+            mismatched.append(field.key)
+    return mismatched
@@ -1180,6 +1180,26 @@ chapter_keysanity_tags = {
     8: "palace"
 }
 
+rel_chapters = {
+    "tik": 0,
+    "hei": 1,
+    "gon": 1,
+    "win": 2,
+    "mri": 2,
+    "tou": 3,
+    "gra": 4,
+    "jin": 4,
+    "muj": 5,
+    "dou": 5,
+    "eki": 6,
+    "pik": 6,
+    "bom": 7,
+    "moo": 7,
+    "aji": 7,
+    "las": 8,
+    "jon": 8
+}
+
 pit_exclusive_tattle_stars_required = {
     1: [
         "Tattle: Gloomba",
@@ -0,0 +1,413 @@
+import copy
+import hashlib
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+GCM_DISC_SIZE = 0x57058000
+BOOT_SIZE = 0x440
+BI2_OFFSET = 0x440
+BI2_SIZE = 0x2000
+APPLOADER_OFFSET = 0x2440
+RELOCATION_ALIGNMENT = 0x8000
+COPY_CHUNK_SIZE = 0x400000
+KERNEL_COPY_CHUNK_SIZE = 0x4000000
+FICLONE = 0x40049409
+
+OVERLAY_MAGIC = b"TTOV"
+OVERLAY_VERSION = 1
+OVERLAY_FILE_ENDING = ".ttydov"
+MANIFEST_VERSION = 1
+MANIFEST_FILE_ENDING = ".manifest.json"
+
+_FST_ENTRY = struct.Struct(">III")
+_OVERLAY_HEADER = struct.Struct(">4sB3xQ32sI")
+_OVERLAY_RECORD = struct.Struct(">QI")
+_DOL_HEADER = struct.Struct(">18I18I18I")
+
+
+def _align(value: int, alignment: int) -> int:
+    return (value + alignment - 1) & ~(alignment - 1)
+
+
+def _dol_size(header: bytes) -> int:
+    fields = _DOL_HEADER.unpack_from(header)
+    offsets, sizes = fields[0:18], fields[36:54]
+    return max([0x100] + [offset + size for offset, size in zip(offsets, sizes) if size])
+
+
+def reflink(source_fd: int, output_fd: int) -> bool:
+    """Makes output_fd a copy-on-write clone of source_fd where the filesystem supports it (Btrfs, XFS)."""
+    try:
+        import fcntl
+        fcntl.ioctl(output_fd, FICLONE, source_fd)
+        return True
+    except (ImportError, OSError):
+        return False
+
+
+def _sendfile(source_fd: int, output_fd: int, offset: int, count: int) -> int:
+    os.lseek(output_fd, offset, os.SEEK_SET)
+    return os.sendfile(output_fd, source_fd, offset, count)
+
+
+def _kernel_copies() -> list:
+    copies = []
+    if hasattr(os, "copy_file_range"):
+        copies.append(lambda source_fd, output_fd, offset, count:
+                      os.copy_file_range(source_fd, output_fd, count, offset, offset))
+    if hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+        copies.append(_sendfile)
+    return copies
+
+
+def copy_image(source: mmap.mmap, source_fd: int, output_fd: int) -> Iterator[int]:
+    """
+    Copies the whole source image to output_fd, yielding the bytes copied so far.
+    Tries a reflink first, then copy_file_range and sendfile so the data never passes through Python,
+    and falls back to writing slices of the mapping. Each method picks up where the last one stopped.
+    """
+    size = len(source)
+    if reflink(source_fd, output_fd):
+        yield size
+        return
+
+    copied = 0
+    for copy in _kernel_copies():
+        try:
+            while copied < size:
+                step = copy(source_fd, output_fd, copied, min(KERNEL_COPY_CHUNK_SIZE, size - copied))
+                if not step:
+                    break
+                copied += step
+                yield copied
+        except OSError:
+            continue
+        if copied >= size:
+            return
+
+    os.lseek(output_fd, copied, os.SEEK_SET)
+    with memoryview(source) as view:
+        while copied < size:
+            copied += os.write(output_fd, view[copied:copied + COPY_CHUNK_SIZE])
+            yield copied
+
+
+class StreamingGCM:
+    """
+    Drop-in for the parts of gclib's GCM the patcher uses, without holding the disc in memory.
+    The source image is memory mapped and only boot.bin and the FST are parsed up front; file data is
+    sliced out of the mapping on request, and the export clones the image with copy_image before
+    writing changed files over it.
+    Changed files that still fit their original extent are written in place, anything larger or new
+    is placed in free space on the disc, and the FST and boot.bin header are rewritten to match.
+    """
+
+    def __init__(self, iso_path: str):
+        self.iso_path = iso_path
+        self.changed_files: Dict[str, Union[io.BytesIO, bytes, None]] = {}
+        self.files: Dict[str, Tuple[int, int]] = {}
+        self.directories: Set[str] = {"files"}
+        self.owns_mapping = True
+        self.iso_file = open(iso_path, "rb")
+        self.iso_data = mmap.mmap(self.iso_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.iso_size = len(self.iso_data)
+
+        self.dol_offset, self.fst_offset, self.fst_size, self.fst_max_size = \
+            struct.unpack_from(">IIII", self.iso_data, 0x420)
+        apploader_size, trailer_size = struct.unpack_from(">II", self.iso_data, APPLOADER_OFFSET + 0x14)
+        self.apploader_size = 0x20 + apploader_size + trailer_size
+        self.dol_size = _dol_size(self.iso_data[self.dol_offset:self.dol_offset + _DOL_HEADER.size])
+        self._parse_fst(self.iso_data[self.fst_offset:self.fst_offset + self.fst_size])
+
+    def clone(self) -> "StreamingGCM":
+        """A view of the same disc with no changes that shares this one's mapping; only the original closes it."""
+        clone = copy.copy(self)
+        clone.changed_files = {}
+        clone.files = dict(self.files)
+        clone.directories = set(self.directories)
+        clone.owns_mapping = False
+        return clone
+
+    def close(self) -> None:
+        if self.owns_mapping:
+            self.iso_data.close()
+            self.iso_file.close()
+
+    def _parse_fst(self, fst: bytes) -> None:
+        entry_count = _FST_ENTRY.unpack_from(fst, 0)[2]
+        string_table = entry_count * _FST_ENTRY.size
+        dir_ends: List[Tuple[int, str]] = [(entry_count, "files")]
+        for index in range(1, entry_count):
+            while index >= dir_ends[-1][0]:
+                dir_ends.pop()
+            flags_name, offset, size = _FST_ENTRY.unpack_from(fst, index * _FST_ENTRY.size)
+            name_start = string_table + (flags_name & 0xFFFFFF)
+            name = fst[name_start:fst.index(b"\x00", name_start)].decode("shift_jis")
+            path = f"{dir_ends[-1][1]}/{name}"
+            if flags_name >> 24:
+                self.directories.add(path)
+                dir_ends.append((size, path))
+            else:
+                self.files[path] = (offset, size)
+
+    def _extent(self, file_path: str) -> Tuple[int, int]:
+        if file_path == "sys/main.dol":
+            return self.dol_offset, self.dol_size
+        if file_path == "sys/boot.bin":
+            return 0, BOOT_SIZE
+        if file_path == "sys/bi2.bin":
+            return BI2_OFFSET, BI2_SIZE
+        if file_path == "sys/apploader.img":
+            return APPLOADER_OFFSET, self.apploader_size
+        if file_path == "sys/fst.bin":
+            return self.fst_offset, self.fst_size
+        if file_path not in self.files:
+            raise Exception(f"Could not find file {file_path} on the disc")
+        return self.files[file_path]
+
+    def read_entire_disc(self) -> None:
+        # The FST is parsed on construction; kept so callers written against gclib still work.
+        pass
+
+    def read_file_data(self, file_path: str) -> io.BytesIO:
+        if self.changed_files.get(file_path) is not None:
+            return io.BytesIO(bytes(self._changed_data(file_path)))
+        offset, size = self._extent(file_path)
+        return io.BytesIO(self.iso_data[offset:offset + size])
+
+    def add_new_directory(self, dir_path: str) -> None:
+        parent = dir_path.rsplit("/", 1)[0]
+        if not dir_path.startswith("files/") or parent not in self.directories:
+            raise Exception(f"Cannot add directory {dir_path}, parent directory does not exist")
+        if dir_path in self.directories or dir_path in self.files:
+            raise Exception(f"Cannot add directory {dir_path}, it already exists")
+        self.directories.add(dir_path)
+
+    def add_new_file(self, file_path: str, file_data: Optional[io.BytesIO] = None) -> None:
+        parent = file_path.rsplit("/", 1)[0]
+        if parent not in self.directories:
+            raise Exception(f"Cannot add file {file_path}, parent directory does not exist")
+        if file_path in self.files or file_path in self.directories:
+            raise Exception(f"Cannot add file {file_path}, it already exists")
+        self.changed_files[file_path] = file_data if file_data is not None else io.BytesIO()
+
+    def _changed_data(self, file_path: str) -> memoryview:
+        data = self.changed_files[file_path]
+        if isinstance(data, io.BytesIO):
+            return data.getbuffer()
+        return memoryview(data)
+
+    def _reserved_extents(self, moved: Set[str]) -> List[Tuple[int, int]]:
+        extents = [(0, APPLOADER_OFFSET + self.apploader_size), (self.fst_offset, self.fst_max_size)]
+        if "sys/main.dol" not in moved:
+            extents.append((self.dol_offset, self.dol_size))
+        extents += [extent for path, extent in self.files.items() if path not in moved]
+        return sorted(extents)
+
+    def _allocate(self, sizes: Dict[str, int], reserved: List[Tuple[int, int]]) -> Dict[str, int]:
+        gaps = []
+        cursor = 0
+        for offset, size in reserved + [(max(GCM_DISC_SIZE, self.iso_size), 0)]:
+            start = _align(cursor, RELOCATION_ALIGNMENT)
+            if offset > start:
+                gaps.append([start, offset])
+            cursor = max(cursor, offset + size)
+
+        placements = {}
+        for path, size in sorted(sizes.items(), key=lambda item: -item[1]):
+            gap = next((gap for gap in gaps if gap[1] - gap[0] >= size), None)
+            if gap is None:
+                raise Exception(f"Not enough free space on the disc to place {path} ({size:#x} bytes)")
+            placements[path] = gap[0]
+            gap[0] = _align(gap[0] + size, RELOCATION_ALIGNMENT)
+        return placements
+
+    def _build_fst(self, extents: Dict[str, Tuple[int, int]]) -> bytes:
+        tree: Dict[str, dict] = {}
+        for path in sorted(self.directories - {"files"}):
+            node = tree
+            for part in path.split("/")[1:]:
+                node = node.setdefault(part, {})
+        for path in extents:
+            if not path.startswith("files/"):
+                continue
+            *parents, name = path.split("/")[1:]
+            node = tree
+            for part in parents:
+                node = node[part]
+            node[name] = path
+
+        entries = [[0x01000000, 0, 0]]
+        names = bytearray()
+
+        def add_children(node: dict, parent: int) -> None:
+            for name in sorted(node, key=str.lower):
+                name_offset = len(names)
+                names.extend(name.encode("shift_jis") + b"\x00")
+                child = node[name]
+                if isinstance(child, dict):
+                    index = len(entries)
+                    entries.append([0x01000000 | name_offset, parent, 0])
+                    add_children(child, index)
+                    entries[index][2] = len(entries)
+                else:
+                    offset, size = extents[child]
+                    entries.append([name_offset, offset, size])
+
+        add_children(tree, 0)
+        entries[0][2] = len(entries)
+        return b"".join(_FST_ENTRY.pack(*entry) for entry in entries) + bytes(names)
+
+    def base_digest(self) -> bytes:
+        """Identifies the base image an overlay was made from: boot.bin plus the FST."""
+        digest = hashlib.sha256(self.iso_data[0:BOOT_SIZE])
+        digest.update(self.iso_data[self.fst_offset:self.fst_offset + self.fst_size])
+        return digest.digest()
+
+    def export_writes(self) -> List[Tuple[str, int, Union[bytes, memoryview]]]:
+        """Every (path, disc offset, data) write that turns the base image into the patched one."""
+        unknown = [path for path in self.changed_files if path.startswith("sys/") and path != "sys/main.dol"]
+        if unknown:
+            raise Exception(f"Streaming export cannot change system files: {', '.join(unknown)}")
+
+        changed = {path: self._changed_data(path) for path in self.changed_files if self.changed_files[path] is not None}
+        moved = {path for path, data in changed.items()
+                 if (path not in self.files and path != "sys/main.dol") or len(data) > self._extent(path)[1]}
+
+        extents = dict(self.files)
+        for path, data in changed.items():
+            if path in extents:
+                extents[path] = (extents[path][0], len(data))
+        fst_size = len(self._build_fst({**extents, **{path: (0, len(changed[path])) for path in moved}}))
+
+        reserved = self._reserved_extents(moved)
+        sizes = {path: len(changed[path]) for path in moved}
+        fst_in_place = fst_size <= self.fst_max_size
+        if not fst_in_place:
+            reserved = [extent for extent in reserved if extent != (self.fst_offset, self.fst_max_size)]
+            sizes["sys/fst.bin"] = fst_size
+        placements = self._allocate(sizes, reserved)
+
+        dol_offset = placements.get("sys/main.dol", self.dol_offset)
+        fst_offset = placements.get("sys/fst.bin", self.fst_offset)
+        for path in moved:
+            if path != "sys/main.dol":
+                extents[path] = (placements[path], len(changed[path]))
+        fst = self._build_fst(extents)
+
+        writes = [(path, dol_offset if path == "sys/main.dol" else extents[path][0], data)
+                  for path, data in changed.items()]
+        writes.append(("sys/fst.bin", fst_offset, fst))
+        writes.append(("sys/boot.bin", 0x420, struct.pack(">IIII", dol_offset, fst_offset, len(fst),
+                                                          max(len(fst), self.fst_max_size))))
+        return writes
+
+    def export_disc_to_iso_with_changed_files(self, output_file_path: str) -> Iterator[Tuple[str, int]]:
+        writes = self.export_writes()
+        with open(output_file_path, "wb", buffering=0) as output:
+            for copied in copy_image(self.iso_data, self.iso_file.fileno(), output.fileno()):
+                yield "sys/boot.bin", copied
+            for path, offset, data in writes:
+                output.seek(offset)
+                output.write(data)
+                yield path, len(data)
+
+    def export_overlay(self, output_file_path: str) -> Iterator[Tuple[str, int]]:
+        """
+        Writes only the changed extents, the rebuilt FST and the new boot.bin fields, tagged with
+        the base image they apply to. apply_overlay turns base image plus overlay back into the iso.
+        """
+        writes = self.export_writes()
+        with open(output_file_path, "wb") as output:
+            output.write(_OVERLAY_HEADER.pack(OVERLAY_MAGIC, OVERLAY_VERSION, self.iso_size,
+                                              self.base_digest(), len(writes)))
+            for path, offset, data in writes:
+                output.write(_OVERLAY_RECORD.pack(offset, len(data)))
+                output.write(data)
+                yield path, len(data)
+
+
+def overlay_path_for(iso_path: str) -> str:
+    return os.path.splitext(iso_path)[0] + OVERLAY_FILE_ENDING
+
+
+def apply_overlay(base_path: str, overlay_path: str, output_path: str) -> Iterator[Tuple[str, int]]:
+    """Rebuilds a patched iso from the base image and an overlay written by StreamingGCM.export_overlay."""
+    base = StreamingGCM(base_path)
+    try:
+        with open(overlay_path, "rb") as overlay:
+            magic, version, base_size, digest, count = _OVERLAY_HEADER.unpack(overlay.read(_OVERLAY_HEADER.size))
+            if magic != OVERLAY_MAGIC or version != OVERLAY_VERSION:
+                raise Exception(f"Unsupported overlay (magic {magic!r}, version {version})")
+            if base_size != base.iso_size or digest != base.base_digest():
+                raise Exception(f"{overlay_path} was not made from the iso at {base_path}")
+            with open(output_path, "wb", buffering=0) as output:
+                for copied in copy_image(base.iso_data, base.iso_file.fileno(), output.fileno()):
+                    yield "sys/boot.bin", copied
+                for _ in range(count):
+                    offset, size = _OVERLAY_RECORD.unpack(overlay.read(_OVERLAY_RECORD.size))
+                    output.seek(offset)
+                    output.write(overlay.read(size))
+                    yield overlay_path, size
+    finally:
+        base.close()
+
+
+def manifest_path_for(iso_path: str) -> str:
+    return os.path.splitext(iso_path)[0] + MANIFEST_FILE_ENDING
+
+
+def build_manifest(changed_files: Dict[str, Union[io.BytesIO, bytes, None]], **info: Any) -> Dict[str, Any]:
+    """
+    Size and SHA-256 of every changed file of a patched disc, plus whatever identifying info the
+    caller passes in. verify_disc checks an iso against it by reading only those files.
+    """
+    files = {}
+    for path in sorted(changed_files):
+        data = changed_files[path]
+        if data is None:
+            continue
+        with (data.getbuffer() if isinstance(data, io.BytesIO) else memoryview(data)) as view:
+            files[path] = {"size": len(view), "sha256": hashlib.sha256(view).hexdigest()}
+    return {"version": MANIFEST_VERSION, **info, "files": files}
+
+
+def write_manifest(manifest_path: str, manifest: Dict[str, Any]) -> None:
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+
+
+def read_manifest(manifest_path: str) -> Dict[str, Any]:
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise Exception(f"Unsupported manifest version {manifest.get('version')} in {manifest_path}")
+    return manifest
+
+
+def verify_disc(iso_path: str, manifest: Dict[str, Any]) -> List[str]:
+    """Paths from the manifest whose data in the iso is missing or differs; empty if the iso matches."""
+    iso = StreamingGCM(iso_path)
+    try:
+        mismatched = []
+        for path, expected in manifest["files"].items():
+            try:
+                offset, size = iso._extent(path)
+            except Exception:
+                mismatched.append(path)
+                continue
+            if path == "sys/main.dol":
+                # The DOL has no FST entry; its size on the disc is only implied by its header
+                size = expected["size"]
+            data = iso.iso_data[offset:offset + size]
+            if size != expected["size"] or hashlib.sha256(data).hexdigest() != expected["sha256"]:
+                mismatched.append(path)
+        return mismatched
+    finally:
+        iso.close()
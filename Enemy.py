@@ -1,7 +1,12 @@
+import struct
 import typing
-from collections import defaultdict
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from functools import lru_cache
 
-from .Options import EnemyRandomizer
+from .Data import rel_chapters
+from .Options import EnemyRandomizer, EncounterShuffleType
 
 if typing.TYPE_CHECKING:
     from . import TTYDWorld
@@ -12,27 +17,271 @@ class Encounter:
     rel: str
     location_id: int | None
     enemy_count: int
-    enemy_ids: list[int]
+    enemy_ids: array
 
-    def __init__(self, name: str, rel: str, location_id: int | None, enemy_count: int, enemy_ids: list[str]):
+    def __init__(self, name: str, rel: str, location_id: int | None, enemy_count: int,
+                 enemy_ids: bytes | typing.Iterable[int]):
         self.name = name
         self.rel = rel
         self.location_id = location_id
         self.enemy_count = enemy_count
-        self.enemy_ids = [int(_id, 0) for _id in enemy_ids]
+        self.enemy_ids = array("B", enemy_ids)
 
-def parse_json_encounters() -> list[Encounter]:
+
+@lru_cache(maxsize=None)
+def _encounter_table() -> tuple[tuple[str, str, int | None, int, bytes], ...]:
     import json
     import pkgutil
 
-    return (json.loads(pkgutil.get_data(__name__, "json/enemies.json").decode("utf-8"),
-                       object_hook=lambda d: Encounter(**d)))
+    return tuple((d["name"], d["rel"], d["location_id"], d["enemy_count"], bytes(int(_id, 0) for _id in d["enemy_ids"]))
+                 for d in json.loads(pkgutil.get_data(__name__, "json/enemies.json").decode("utf-8")))
+
+
+def parse_json_encounters() -> list[Encounter]:
+    # The json is parsed once per process; every world gets fresh encounters it is free to shuffle.
+    return [Encounter(*entry) for entry in _encounter_table()]
+
+
+# enemies.bin v1: >H group count, then per group a count byte followed by one byte per enemy id.
+# The mod walks it linearly, so older builds keep reading this layout from files/mod/enemies.bin.
+#
+# enemies_v2.bin: a header, a per-rel directory and fixed-stride group records, so the mod can jump
+# straight to a rel's table. Groups keep the order they have within their rel in enemies.json.
+#   header     >4sBBH  magic, version, record stride, rel count
+#   directory  >4sHH   rel name (NUL padded), index of the rel's first record, record count
+#   records    stride bytes each: enemy count followed by the enemy ids, zero padded
+ENEMIES_BIN_MAGIC = b"TTEN"
+ENEMIES_BIN_VERSION = 2
+MAX_GROUP_SIZE = 5
+_V2_HEADER = struct.Struct(">4sBBH")
+_V2_DIRECTORY_ENTRY = struct.Struct(">4sHH")
+_V2_STRIDE = 1 + MAX_GROUP_SIZE
+
+
+def pack_encounters_v1(encounters: list[Encounter]) -> bytes:
+    buffer = bytearray(2 + sum(1 + len(encounter.enemy_ids) for encounter in encounters))
+    struct.pack_into(">H", buffer, 0, len(encounters))
+    offset = 2
+    for encounter in encounters:
+        ids = encounter.enemy_ids
+        buffer[offset] = len(ids)
+        buffer[offset + 1:offset + 1 + len(ids)] = ids
+        offset += 1 + len(ids)
+    return bytes(buffer)
+
+
+def pack_encounters_v2(encounters: list[Encounter]) -> bytes:
+    by_rel: dict[str, list[Encounter]] = defaultdict(list)
+    for encounter in encounters:
+        by_rel[encounter.rel].append(encounter)
+
+    buffer = bytearray(_V2_HEADER.size + _V2_DIRECTORY_ENTRY.size * len(by_rel) + _V2_STRIDE * len(encounters))
+    _V2_HEADER.pack_into(buffer, 0, ENEMIES_BIN_MAGIC, ENEMIES_BIN_VERSION, _V2_STRIDE, len(by_rel))
+    directory_offset = _V2_HEADER.size
+    records_offset = directory_offset + _V2_DIRECTORY_ENTRY.size * len(by_rel)
+    index = 0
+    for rel, encs in by_rel.items():
+        _V2_DIRECTORY_ENTRY.pack_into(buffer, directory_offset, rel.encode("ascii"), index, len(encs))
+        directory_offset += _V2_DIRECTORY_ENTRY.size
+        for encounter in encs:
+            ids = encounter.enemy_ids
+            if len(ids) > MAX_GROUP_SIZE:
+                raise ValueError(f"Encounter {encounter.name} has {len(ids)} enemies, "
+                                 f"enemies.bin v2 holds at most {MAX_GROUP_SIZE}")
+            offset = records_offset + index * _V2_STRIDE
+            buffer[offset] = len(ids)
+            buffer[offset + 1:offset + 1 + len(ids)] = ids
+            index += 1
+    return bytes(buffer)
+
+
+def unpack_encounters(data: bytes) -> list[tuple[str | None, array]]:
+    """Reads either enemies.bin layout back into (rel, enemy ids) pairs. v1 carries no rel, so it reads as None."""
+    if data[:len(ENEMIES_BIN_MAGIC)] != ENEMIES_BIN_MAGIC:
+        (count,) = struct.unpack_from(">H", data, 0)
+        groups = []
+        offset = 2
+        for _ in range(count):
+            length = data[offset]
+            groups.append((None, array("B", data[offset + 1:offset + 1 + length])))
+            offset += 1 + length
+        return groups
+
+    _, version, stride, rel_count = _V2_HEADER.unpack_from(data, 0)
+    if version != ENEMIES_BIN_VERSION:
+        raise ValueError(f"Unsupported enemies.bin version {version}")
+    records_offset = _V2_HEADER.size + _V2_DIRECTORY_ENTRY.size * rel_count
+    groups = []
+    for rel, first, count in _V2_DIRECTORY_ENTRY.iter_unpack(data[_V2_HEADER.size:records_offset]):
+        rel = rel.rstrip(b"\x00").decode("ascii")
+        for index in range(first, first + count):
+            offset = records_offset + index * stride
+            groups.append((rel, array("B", data[offset + 1:offset + 1 + data[offset]])))
+    return groups
+
+
+class EncounterCoverage:
+    """Records where every enemy id lands while encounters are assigned, so the tattle rules can be read
+    straight off the shuffle instead of rescanning the encounters afterwards."""
+
+    def __init__(self, encounters: list[Encounter]):
+        self.expected = Counter(_id for enc in encounters for _id in enc.enemy_ids)
+        self.placed: Counter = Counter()
+        self.locations: dict[int, dict[int, None]] = defaultdict(dict)
+
+    def place(self, encounter: Encounter, group: array) -> None:
+        encounter.enemy_ids = group
+        self.placed.update(group)
+        for _id in group:
+            self.locations[_id][encounter.location_id] = None
+
+    def verify(self) -> None:
+        missing = sorted(_id for _id in self.expected if self.placed[_id] == 0)
+        if missing:
+            raise ValueError(f"Enemy randomizer failed to place enemies: {[hex(_id) for _id in missing]}")
+
+    def enemy_locations(self) -> dict[int, list[int]]:
+        return {_id: list(locations) for _id, locations in self.locations.items()}
+
+
+def default_enemy_scores(encounters: list[Encounter]) -> dict[int, float]:
+    """Scores every enemy by the earliest chapter it appears in."""
+    scores: dict[int, float] = {}
+    for enc in encounters:
+        chapter = rel_chapters[enc.rel]
+        for _id in enc.enemy_ids:
+            scores[_id] = min(scores.get(_id, chapter), chapter)
+    return scores
+
+
+def group_score(enemy_ids, scores: dict[int, float]) -> float:
+    return sum(scores.get(_id, 0.0) for _id in enemy_ids) / len(enemy_ids)
 
-def randomize_encounters(world: "TTYDWorld") -> None:
+
+def chapter_bands(encounters: list[Encounter], scores: dict[int, float],
+                  tolerance: float = 0.0) -> dict[int, tuple[float, float]]:
+    """Difficulty band per chapter, spanning the scores of that chapter's vanilla encounters."""
+    bands: dict[int, tuple[float, float]] = {}
+    for enc in encounters:
+        chapter = rel_chapters[enc.rel]
+        score = group_score(enc.enemy_ids, scores)
+        lo, hi = bands.get(chapter, (score, score))
+        bands[chapter] = (min(lo, score), max(hi, score))
+    return {chapter: (lo - tolerance, hi + tolerance) for chapter, (lo, hi) in bands.items()}
+
+
+class _ScoreBucket:
+    """Groups of a single size sorted by score. Taken slots are skipped with a union-find,
+    so finding the easiest free group at or above a score is amortized near-constant."""
+
+    def __init__(self, entries: list[tuple[float, array]]):
+        entries.sort(key=lambda entry: entry[0])
+        self.scores = [score for score, _ in entries]
+        self.groups = [group for _, group in entries]
+        self._next = list(range(len(entries) + 1))
+
+    def _find(self, i: int) -> int:
+        root = i
+        while self._next[root] != root:
+            root = self._next[root]
+        while self._next[i] != root:
+            self._next[i], i = root, self._next[i]
+        return root
+
+    def first_free(self, score: float) -> int:
+        return self._find(bisect_left(self.scores, score))
+
+    def take(self, i: int) -> array:
+        self._next[i] = i + 1
+        return self.groups[i]
+
+    def leftovers(self) -> list[tuple[float, array]]:
+        return [(self.scores[i], self.groups[i]) for i in range(len(self.groups)) if self._find(i) == i]
+
+
+def balance_encounters(encounters: list[Encounter], groups: list[array], random, scores: dict[int, float],
+                       bands: dict[int, tuple[float, float]], coverage: EncounterCoverage) -> None:
+    """Assigns each encounter one of the given groups so its score falls in the band of the encounter's chapter.
+
+    Encounters are served lowest band ceiling first, each taking the easiest free group of the right size inside
+    its band, so the easy groups an early chapter needs are not used up by later chapters.
+    Whatever is left over is repaired by pairing the remaining encounters and groups of each size in score order.
+    Every group is placed exactly once, so every enemy in the pool still appears somewhere."""
+    entries: dict[int, list] = defaultdict(list)
+    random.shuffle(groups)
+    for group in groups:
+        entries[len(group)].append((group_score(group, scores), group))
+    buckets = {key: _ScoreBucket(value) for key, value in entries.items()}
+
+    order = list(range(len(encounters)))
+    random.shuffle(order)
+    order.sort(key=lambda n: bands[rel_chapters[encounters[n].rel]][1])
+
+    deferred: dict[int, list[int]] = defaultdict(list)
+    for n in order:
+        encounter = encounters[n]
+        chapter = rel_chapters[encounter.rel]
+        lo, hi = bands[chapter]
+        bucket = buckets.get(encounter.enemy_count)
+        i = bucket.first_free(lo) if bucket is not None else 0
+        if bucket is not None and i < len(bucket.scores) and bucket.scores[i] <= hi:
+            coverage.place(encounter, bucket.take(i))
+        else:
+            deferred[encounter.enemy_count].append(n)
+
+    for size, pending in deferred.items():
+        leftovers = buckets[size].leftovers() if size in buckets else []
+        if len(leftovers) != len(pending):
+            raise ValueError(f"Cannot repair {len(pending)} encounters of size {size} "
+                             f"with {len(leftovers)} remaining groups")
+        leftovers.sort(key=lambda entry: entry[0])
+        pending.sort(key=lambda n: sum(bands[rel_chapters[encounters[n].rel]]))
+        # The easiest leftovers go to the earliest encounters
+        for n, (_, group) in zip(pending, leftovers):
+            coverage.place(encounters[n], group)
+
+
+def _concat_ids(encounters: list[Encounter]) -> array:
+    enemies = array("B")
+    for encounter in encounters:
+        enemies += encounter.enemy_ids
+    return enemies
+
+
+def _repartition(enemies: array, encounters: list[Encounter]) -> list[array]:
+    groups = []
+    start = 0
+    for encounter in encounters:
+        groups.append(enemies[start:start + encounter.enemy_count])
+        start += encounter.enemy_count
+    return groups
+
+
+def randomize_encounters(world: "TTYDWorld", scores: dict[int, float] | None = None) -> None:
     encounter_shuffle_type = world.options.encounter_shuffle_type.value
+    coverage = EncounterCoverage(world.encounters)
 
-    # rel -> list[list[enemy_id]]
-    rel_groups: dict[str, list[list[int]]] = defaultdict(list)
+    if encounter_shuffle_type == EncounterShuffleType.option_difficulty_balanced:
+        if scores is None:
+            scores = default_enemy_scores(world.encounters)
+        bands = chapter_bands(world.encounters, scores)
+        if world.options.enemy_randomizer == EnemyRandomizer.option_within_chapter:
+            by_rel = defaultdict(list)
+            for enc in world.encounters:
+                by_rel[enc.rel].append(enc)
+            pools = list(by_rel.values())
+        elif world.options.enemy_randomizer == EnemyRandomizer.option_randomize:
+            pools = [world.encounters]
+        else:
+            raise ValueError(f"Invalid enemy randomizer option: {world.options.enemy_randomizer}")
+        for encs in pools:
+            balance_encounters(encs, [e.enemy_ids[:] for e in encs], world.random, scores, bands, coverage)
+        coverage.verify()
+        world.enemy_locations = coverage.enemy_locations()
+        return
+
+    # rel -> list[array of enemy_id]
+    rel_groups: dict[str, list[array]] = defaultdict(list)
 
     if world.options.enemy_randomizer == EnemyRandomizer.option_within_chapter:
         # Build buckets from existing encounters
@@ -47,9 +296,9 @@ def randomize_encounters(world: "TTYDWorld") -> None:
                 world.random.shuffle(groups)
             elif encounter_shuffle_type == 1:
                 # shuffle individuals within the chapter/rel then repartition by each encounter's size
-                enemies = [_id for e in encs for _id in e.enemy_ids]
+                enemies = _concat_ids(encs)
                 world.random.shuffle(enemies)
-                groups = [[enemies.pop() for _ in range(e.enemy_count)] for e in encs]
+                groups = _repartition(enemies, encs)
                 world.random.shuffle(groups)
             else:
                 raise ValueError(f"Invalid encounter_shuffle_type: {encounter_shuffle_type}")
@@ -64,9 +313,9 @@ def randomize_encounters(world: "TTYDWorld") -> None:
             groups = [e.enemy_ids[:] for e in world.encounters]
             world.random.shuffle(groups)
         elif encounter_shuffle_type == 1:
-            enemies = [_id for e in world.encounters for _id in e.enemy_ids]
+            enemies = _concat_ids(world.encounters)
             world.random.shuffle(enemies)
-            groups = [[enemies.pop() for _ in range(e.enemy_count)] for e in world.encounters]
+            groups = _repartition(enemies, world.encounters)
             world.random.shuffle(groups)
         else:
             raise ValueError(f"Invalid encounter_shuffle_type: {encounter_shuffle_type}")
@@ -89,4 +338,7 @@ def randomize_encounters(world: "TTYDWorld") -> None:
                 f"(rel={getattr(encounter,'rel',None)}). Available sizes in bucket: {sizes}"
             )
 
-        encounter.enemy_ids = bucket.pop(idx)
+        coverage.place(encounter, bucket.pop(idx))
+
+    coverage.verify()
+    world.enemy_locations = coverage.enemy_locations()
@@ -280,10 +280,13 @@ class EncounterShuffleType(Choice):
     Enemy randomizer must be set to either within_chapter or random for this option to have an effect.
     vanilla_groups: Enemies will be grouped by encounter, and shuffled as a group.
     custom_groups: Enemies will be shuffled individually, and grouped into new encounters based on their new enemy count.
+    difficulty_balanced: Enemies will be shuffled as a group, but each encounter only receives a group that fits the
+    difficulty of the chapter it appears in.
     """
     display_name = "Enemy Randomizer Grouping"
     option_vanilla_groups = 0
     option_custom_groups = 1
+    option_difficulty_balanced = 2
     default = 0
 
 
@@ -0,0 +1,275 @@
+import hashlib
+import json
+import os
+import shutil
+import struct
+import threading
+
+from typing import Callable, Dict, Iterable, Optional
+from .Disc import BOOT_SIZE, MANIFEST_FILE_ENDING, reflink
+
+HASH_CHUNK_SIZE = 0x800000
+
+CACHE_MEMBERS = ("options.json", "locations.bin", "locations.json", "writes.bin", "enemies.bin", "enemies_v2.bin",
+                 "desc.txt")
+
+
+def cache_key(base_hash: str, world_version: Optional[str], members: Iterable[Optional[bytes]]) -> str:
+    """
+    Content key for a patched iso: the base iso hash, the world version doing the patching
+    (the patch code and bundled mod files change with it) and every patch member that feeds the output.
+    """
+    digest = hashlib.sha256()
+    digest.update(base_hash.encode("utf-8"))
+    digest.update(b"\x00" + str(world_version).encode("utf-8"))
+    for data in members:
+        digest.update(b"\x00" if data is None else len(data).to_bytes(8, "big") + data)
+    return digest.hexdigest()
+
+
+def _staging_path(path: str) -> str:
+    # Unique per process and thread, so concurrent writers of the same file never share a staging file
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def remove_output(path: str) -> None:
+    """
+    Deletes an old output before it is written again. Outputs may be hard links to patched iso cache
+    entries, so writing over one in place would change the cached copy as well.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _link(source: str, target: str) -> bool:
+    # Written to a temporary name and renamed over the target, so the target is never truncated in place.
+    # That matters because cache entries and outputs can be hard links to the same file.
+    temp = _staging_path(target)
+    if os.path.exists(temp):
+        os.remove(temp)
+    try:
+        os.link(source, temp)
+    except OSError:
+        try:
+            with open(source, "rb") as source_file, open(temp, "wb") as temp_file:
+                linked = reflink(source_file.fileno(), temp_file.fileno())
+        except OSError:
+            linked = False
+        if not linked:
+            if os.path.exists(temp):
+                os.remove(temp)
+            return False
+    os.replace(temp, target)
+    return True
+
+
+def _link_or_copy(source: str, target: str) -> None:
+    if _link(source, target):
+        return
+    temp = _staging_path(target)
+    shutil.copyfile(source, temp)
+    os.replace(temp, target)
+
+
+class PatchedIsoCache:
+    """
+    Least recently used cache of patched isos, stored as <key>.iso in a directory next to the
+    iso's <key>.manifest.json.
+    Entries are only stored when the output can be hard linked or reflinked into the directory; a second
+    full copy of every patched iso would cost more than the cache saves. Fetching copies if it cannot link.
+    The modification time of an entry is its last use, and the oldest entries are evicted once
+    the directory grows past max_size bytes.
+    """
+
+    def __init__(self, directory: str, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.iso")
+
+    def manifest_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{MANIFEST_FILE_ENDING}")
+
+    def fetch(self, key: str, target: str, manifest: Optional[str] = None) -> bool:
+        entry = self.entry_path(key)
+        if not os.path.isfile(entry):
+            return False
+        os.utime(entry)
+        _link_or_copy(entry, target)
+        if manifest is not None and os.path.isfile(self.manifest_path(key)):
+            _link_or_copy(self.manifest_path(key), manifest)
+        return True
+
+    def store(self, key: str, source: str, manifest: Optional[str] = None) -> None:
+        if self.max_size <= 0 or os.path.getsize(source) > self.max_size:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if not _link(source, self.entry_path(key)):
+            return
+        if manifest is not None and os.path.isfile(manifest):
+            _link_or_copy(manifest, self.manifest_path(key))
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            # Staging files left by an interrupted store take space too; a live one may be renamed meanwhile
+            if not name.endswith((".iso", ".tmp")):
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            manifest = os.path.splitext(path)[0] + MANIFEST_FILE_ENDING
+            if os.path.exists(manifest):
+                os.remove(manifest)
+            total -= size
+
+
+def iso_fingerprint(iso_path: str, base_hash: str) -> str:
+    """
+    Cheap stand-in for hashing the whole base iso: its size and modification time plus the
+    boot.bin header and the FST, which between them pin down every file's location and size.
+    """
+    stat = os.stat(iso_path)
+    with open(iso_path, "rb") as iso:
+        boot = iso.read(BOOT_SIZE)
+        fst_offset, fst_size = struct.unpack_from(">II", boot, 0x424)
+        iso.seek(fst_offset)
+        fst = iso.read(fst_size)
+    digest = hashlib.sha256()
+    digest.update(base_hash.encode("utf-8"))
+    digest.update(struct.pack(">QQ", stat.st_size, stat.st_mtime_ns))
+    digest.update(boot)
+    digest.update(fst)
+    return digest.hexdigest()
+
+
+class PristineAssetCache:
+    """
+    Files read out of one base iso, and outputs derived only from them, kept on disk so the next
+    patch does not have to extract or rebuild them. One directory per iso fingerprint; only the
+    most recently used few are kept. The cache is best effort and falls back to producing the
+    data when the directory cannot be written.
+    """
+
+    def __init__(self, root: str, fingerprint: str, keep: int = 2):
+        self.directory = os.path.join(root, fingerprint)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            os.utime(self.directory)
+            others = sorted((os.stat(os.path.join(root, name)).st_mtime, os.path.join(root, name))
+                            for name in os.listdir(root) if name != fingerprint)
+            for _, path in others[:max(0, len(others) - keep + 1)]:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+    def get(self, name: str, produce: Callable[[], bytes]) -> bytes:
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            pass
+        data = produce()
+        temp = _staging_path(path)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp, "wb") as f:
+                f.write(data)
+            os.replace(temp, path)
+        except OSError:
+            if os.path.exists(temp):
+                os.remove(temp)
+        return data
+
+    def derived(self, name: str, recipe: bytes, produce: Callable[[], bytes]) -> bytes:
+        """Like get, for outputs that also depend on recipe (e.g. a bundled bsdiff patch)."""
+        return self.get(f"{name}.{hashlib.sha256(recipe).hexdigest()[:16]}", produce)
+
+
+def md5_file(path: str, progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """MD5 of a file read in HASH_CHUNK_SIZE chunks, calling progress(bytes done, total) after each one."""
+    total = os.path.getsize(path)
+    digest = hashlib.md5()
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    done = 0
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+            done += read
+            if progress is not None:
+                progress(done, total)
+    return digest.hexdigest()
+
+
+class VerifiedIsoCache:
+    """
+    Base isos whose MD5 has already been checked, stored as a small json file. An entry is keyed on the
+    iso's real path, size, modification time and inode, so replacing or touching the file forces a new check.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @staticmethod
+    def entry_key(iso_path: str) -> str:
+        stat = os.stat(iso_path)
+        return f"{os.path.realpath(iso_path)}|{stat.st_size}|{stat.st_mtime_ns}|{stat.st_ino}"
+
+    def _load(self) -> Dict[str, str]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def is_verified(self, iso_path: str, expected_md5: str) -> bool:
+        return self._load().get(self.entry_key(iso_path)) == expected_md5
+
+    def mark_verified(self, iso_path: str, expected_md5: str) -> None:
+        entries = self._load()
+        real_path = os.path.realpath(iso_path)
+        # Only the current state of each path is kept
+        entries = {key: value for key, value in entries.items() if key.rsplit("|", 3)[0] != real_path}
+        entries[self.entry_key(iso_path)] = expected_md5
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp = _staging_path(self.path)
+            with open(temp, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(temp, self.path)
+        except OSError:
+            pass
+
+
+def validate_base_iso(iso_path: str, expected_md5: str, cache: Optional[VerifiedIsoCache] = None,
+                      progress: Optional[Callable[[int, int], None]] = None) -> None:
+    """
+    Raises if the iso's MD5 is not expected_md5. Hashing 1.4 GB takes a while, so callers with a UI should
+    run this in a worker thread; hashlib releases the GIL while it hashes.
+    """
+    if cache is not None and cache.is_verified(iso_path, expected_md5):
+        return
+    actual = md5_file(iso_path, progress)
+    if actual != expected_md5:
+        raise Exception(f"{iso_path} is not the US release of The Thousand-Year Door "
+                        f"(md5 {actual}, expected {expected_md5})")
+    if cache is not None:
+        cache.mark_verified(iso_path, expected_md5)
@@ -0,0 +1,110 @@
+import json
+import zipfile
+
+from dataclasses import dataclass, fields, asdict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+
+PATCH_OPTIONS_VERSION = 1
+
+
+@dataclass(frozen=True)
+class PatchOptions:
+    """
+    The seed settings stored in a patch as options.json. Defaults are what the patcher used for keys
+    missing from older patches, so a migrated patch behaves exactly as it did before.
+    """
+    world_version: Optional[str] = None
+    seed: int = 0
+    seed_name: str = ""
+    player: int = 0
+    player_name: str = ""
+    yoshi_name: str = "Yoshi"
+    yoshi_color: int = 0
+    starting_partner: int = 1
+    palace_stars: int = 7
+    goal_stars: int = 7
+    starting_coins: int = 100
+    palace_skip: int = 0
+    westside: int = 0
+    peekaboo: int = 0
+    intermissions: int = 0
+    starting_hp: int = 10
+    starting_fp: int = 5
+    starting_bp: int = 3
+    full_run_bar: int = 0
+    required_chapters: Tuple[int, ...] = ()
+    tattlesanity: int = 0
+    fast_travel: int = 0
+    succeed_conditions: int = 0
+    cutscene_skip: int = 0
+    experience_multiplier: int = 1
+    starting_level: int = 1
+    first_attack: int = 0
+    music: int = 0
+    block_visibility: int = 1
+    goal: int = 1
+    star_shuffle: int = 1
+    dazzle_rewards: int = 3
+    shop_purchase_limit: int = 1
+    grubba_bribe_direction: int = 2
+    grubba_bribe_cost: int = 20
+    blue_pipe_toggle: int = 1
+    enemy_randomizer: int = 0
+    enemy_stat_scaling: int = 0
+    shuffle_chapter_stats: int = 0
+    badge_bp: int = 0
+    badge_fp: int = 0
+    partner_fp: int = 0
+    console_mode: int = 0
+    remote_items: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"options_version": PATCH_OPTIONS_VERSION, **asdict(self)}
+
+    def encode(self) -> bytes:
+        # Field order is fixed by the class, so the same options always encode to the same bytes
+        return json.dumps(self.to_dict(), separators=(",", ":")).encode("utf-8")
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PatchOptions":
+        data = migrate_patch_options(dict(data))
+        if "required_chapters" in data:
+            # JSON has no tuples; keep the frozen options hashable
+            data["required_chapters"] = tuple(data["required_chapters"])
+        return cls(**{option.name: data[option.name] for option in fields(cls) if option.name in data})
+
+
+def _migrate_unversioned(data: Dict[str, Any]) -> Dict[str, Any]:
+    # Patches from before options_version have the same keys, just not always all of them;
+    # the missing ones take the class defaults.
+    return data
+
+
+# Upgrades options.json from the keyed version to the next one
+_MIGRATIONS: Dict[int, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    0: _migrate_unversioned,
+}
+
+
+def migrate_patch_options(data: Dict[str, Any]) -> Dict[str, Any]:
+    version = data.pop("options_version", 0)
+    if version > PATCH_OPTIONS_VERSION:
+        raise Exception(f"Patch options version {version} is newer than this apworld supports "
+                        f"({PATCH_OPTIONS_VERSION}); update the apworld")
+    while version < PATCH_OPTIONS_VERSION:
+        data = _MIGRATIONS[version](data)
+        version += 1
+    return data
+
+
+@lru_cache(maxsize=16)
+def load_patch_options(data: bytes) -> PatchOptions:
+    """Decodes options.json; the same bytes are only decoded and migrated once per process."""
+    return PatchOptions.from_dict(json.loads(data.decode("utf-8")))
+
+
+def read_patch_options(patch_file: str) -> PatchOptions:
+    """The options of an .apttyd, read straight from the zip without opening the whole patch."""
+    with zipfile.ZipFile(patch_file) as zf:
+        return load_patch_options(zf.read("options.json"))
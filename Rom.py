@@ -1,18 +1,28 @@
 import io
 import json
+import logging
+import os
 import pkgutil
 import struct
+import zipfile
 
 import bsdiff4
-import random
 
-from typing import TYPE_CHECKING, Dict, Tuple, Iterable
+from typing import TYPE_CHECKING, Callable, Dict, Tuple, Iterable, Optional, List, NamedTuple, FrozenSet
+from collections import defaultdict
+from functools import lru_cache
 from BaseClasses import Location, ItemClassification
 from worlds.Files import APProcedurePatch, APTokenMixin, APPatchExtension, AutoPatchExtensionRegister
 from .Items import items_by_id, ItemData
-from .Locations import locationName_to_data, location_table, location_id_to_name
+from .Locations import locationName_to_data
 from .Data import Rels, shop_items, item_prices, rel_filepaths, location_to_unit, shop_names
-from .TTYDPatcher import TTYDPatcher
+from .APSettings import pack_ap_settings
+from .PatchOptions import PatchOptions, load_patch_options
+from .Enemy import Encounter, pack_encounters_v1, pack_encounters_v2
+from .Disc import StreamingGCM, overlay_path_for, manifest_path_for, build_manifest, write_manifest
+from .PatchCache import (PatchedIsoCache, PristineAssetCache, VerifiedIsoCache, cache_key, remove_output,
+                         validate_base_iso, CACHE_MEMBERS)
+from .TTYDPatcher import TTYDPatcher, find_apworld
 
 if TYPE_CHECKING:
     from . import TTYDWorld
@@ -40,178 +50,222 @@ def _is_infinitely_repurchasable(rom_id: int, limit_mode: int, progression) -> b
     return False
 
 
+WRITES_BIN_MAGIC = b"TTWP"
+WRITES_BIN_VERSION = 1
+_WRITES_HEADER = struct.Struct(">4sBxH")
+_WRITES_GROUP = struct.Struct(">4sH")
+_WRITES_RECORD = struct.Struct(">IB")
+
+LOCATIONS_BIN_MAGIC = b"TTLC"
+LOCATIONS_BIN_VERSION = 1
+_LOCATIONS_HEADER = struct.Struct(">4sBxH")
+_LOCATION_RECORD = struct.Struct(">IqHH")
+
+# Item write kinds: a u32 rom id in a rel, a u32 rom id followed by the u32 shop price,
+# and a u16 rom id in the dol (tattle unit table and Dazzle rewards).
+_WRITE_ITEM = 0
+_WRITE_SHOP_ITEM = 1
+_WRITE_DOL_ITEM = 2
+
+_ITEM_WRITES = {
+    _WRITE_ITEM: (struct.Struct(">I"), 1),
+    _WRITE_SHOP_ITEM: (struct.Struct(">II"), 2),
+    _WRITE_DOL_ITEM: (struct.Struct(">H"), 1),
+}
+
+
+class RelWriteRecords(NamedTuple):
+    by_rel: Dict[Rels, Tuple[Tuple[int, int, int], ...]]
+    location_ids: FrozenSet[int]
+    shop_ids: FrozenSet[int]
+
+
+@lru_cache(maxsize=None)
+def rel_write_records() -> RelWriteRecords:
+    """Every item write patch_items can make, as (offset, kind, location id) grouped by rel and sorted by offset."""
+    shop_ids = frozenset(shop_items)
+    by_rel = defaultdict(list)
+    for data in locationName_to_data.values():
+        if data.id is None:
+            continue
+        if data.rel == Rels.dol:
+            if data.id in location_to_unit:
+                for unit_id in location_to_unit[data.id]:
+                    by_rel[Rels.dol].append((0xB00 + ((unit_id - 1) * 2), _WRITE_DOL_ITEM, data.id))
+            elif "Dazzle" in data.name:
+                by_rel[Rels.dol].append((data.offset[0], _WRITE_DOL_ITEM, data.id))
+            continue
+        for i, offset in enumerate(data.offset):
+            if "30 Coins" in data.name and i == 1:
+                # The Excess Express 30 Coins are also given out from a script in pik
+                by_rel[Rels.pik].append((offset, _WRITE_ITEM, data.id))
+            else:
+                by_rel[data.rel].append((offset, _WRITE_SHOP_ITEM if data.id in shop_ids else _WRITE_ITEM, data.id))
+    return RelWriteRecords(
+        {rel: tuple(sorted(records)) for rel, records in by_rel.items()},
+        frozenset(location_id for records in by_rel.values() for _, _, location_id in records),
+        shop_ids)
+
+
+def item_write_values(locations: Iterable[Tuple[int, int, int, int]], player: int, remote_items: bool,
+                      limit_mode: int, log_error: Callable[[str], None]) -> Dict[int, Tuple[int, int]]:
+    """(rom id, shop price) to write for each (location id, item code, item player, shop price) location."""
+    records = rel_write_records()
+    values: Dict[int, Tuple[int, int]] = {}
+    for location_id, item_id, item_player, shop_price in locations:
+        if location_id not in records.location_ids:
+            continue
+        if item_player != player:
+            item_data = ItemData(id=0, item_name="", progression="filler", rom_id=0x71)
+            rom_id = item_data.rom_id
+        else:
+            item_data = items_by_id.get(item_id, ItemData(id=0, item_name="", progression="filler", rom_id=0x0))
+            rom_id = item_data.rom_id
+            if remote_items and rom_id != 0:
+                is_shop = location_id in records.shop_ids
+                repurchasable = is_shop and _is_infinitely_repurchasable(rom_id, limit_mode, item_data.progression)
+                if not repurchasable:
+                    rom_id = 0x71
+        if rom_id == 0:
+            log_error(f"Item {item_data.item_name} not found in item_type_dict")
+        values[location_id] = (rom_id, 20 if rom_id == 0x71 else shop_price)
+    return values
+
+
+def build_write_plan(locations: Iterable[Tuple[int, int, int, int]], player: int, remote_items: bool,
+                     limit_mode: int, log_error: Callable[[str], None]) -> bytes:
+    """
+    writes.bin: every byte patch_items writes, as a header (magic, version, group count) followed by
+    one group per rel (rel name, record count) of (offset, length, data) records sorted by offset.
+    Rels without a placed location get no group and are never loaded at patch time.
+    """
+    values = item_write_values(locations, player, remote_items, limit_mode, log_error)
+    plan = bytearray()
+    groups = 0
+    for rel, rel_records in rel_write_records().by_rel.items():
+        writes = bytearray()
+        count = 0
+        for offset, kind, location_id in rel_records:
+            value = values.get(location_id)
+            if value is None:
+                continue
+            write, arguments = _ITEM_WRITES[kind]
+            writes += _WRITES_RECORD.pack(offset, write.size)
+            writes += write.pack(*value[:arguments])
+            count += 1
+        if count:
+            plan += _WRITES_GROUP.pack(rel.value.encode("ascii"), count)
+            plan += writes
+            groups += 1
+    return _WRITES_HEADER.pack(WRITES_BIN_MAGIC, WRITES_BIN_VERSION, groups) + bytes(plan)
+
+
+def read_write_plan(data: bytes) -> Dict[Rels, List[Tuple[int, bytes]]]:
+    """Decodes writes.bin into the (offset, data) writes for each rel, in file order."""
+    magic, version, groups = _WRITES_HEADER.unpack_from(data)
+    if magic != WRITES_BIN_MAGIC or version != WRITES_BIN_VERSION:
+        raise Exception(f"Unsupported writes.bin (magic {magic!r}, version {version})")
+    plan: Dict[Rels, List[Tuple[int, bytes]]] = {}
+    position = _WRITES_HEADER.size
+    for _ in range(groups):
+        name, count = _WRITES_GROUP.unpack_from(data, position)
+        position += _WRITES_GROUP.size
+        writes = plan[Rels(name.rstrip(b"\x00").decode("ascii"))] = []
+        for _ in range(count):
+            offset, size = _WRITES_RECORD.unpack_from(data, position)
+            position += _WRITES_RECORD.size
+            writes.append((offset, bytes(data[position:position + size])))
+            position += size
+    return plan
+
+
+def _words(*words: int) -> bytes:
+    return b"".join(int.to_bytes(word, 4, "big") for word in words)
+
+
+# Code patches that only apply when running on Dolphin (console_mode off).
+_EMULATOR_CODE_PATCHES = [
+    (0x3C25FC, _words(0x33F4)),
+    (0x297FB4, _words(0x48000014)),
+    (0x297E74, _words(0x38A503FF)),
+    (0x2D368, _words(0x3C008200, 0x901E0000, 0x3C0083F0, 0x901D0000, 0x48000034)),
+    (0xDC7C, _words(0x3C800001)),
+    (0xDC90, _words(0x38804000)),
+    (0xDCA4, _words(0x3CA00001)),
+    (0xDCB4, _words(0x38A04000)),
+    (0x3E814, _words(0x3860FFFF, 0x4800042C)),
+    (0x3F884, _words(0x38C00200)),
+    (0x3FB18, _words(0x3C050040)),
+] + [(offset, _words(0x3C040040)) for offset in (
+    0x3EF48, 0x3EFF8, 0x3F068, 0x3F118, 0x3F188, 0x3F238,
+    0x3F2A8, 0x3F358, 0x3F3C4, 0x3F474, 0x3F4EC, 0x3F59C,
+    0x3F60C, 0x3F6BC, 0x3F72C, 0x3F7DC, 0x3FD74, 0x3FE24)
+] + [(offset, _words(0x3C800040)) for offset in (0x3F9B4, 0x3FB30, 0x3FE7C)]
+
+
+def _sorted_patches(patches: List[Tuple[int, bytes]]) -> List[Tuple[int, bytes]]:
+    patches = sorted(patches, key=lambda patch: patch[0])
+    for (offset, data), (next_offset, _) in zip(patches, patches[1:]):
+        if offset + len(data) > next_offset:
+            raise Exception(f"DOL patches at {offset:#x} and {next_offset:#x} overlap")
+    return patches
+
+
 class TTYDPatchExtension(APPatchExtension):
     game = "Paper Mario: The Thousand-Year Door"
 
     @staticmethod
     def patch_mod(caller: "TTYDProcedurePatch") -> None:
-        seed_options = json.loads(caller.get_file("options.json").decode("utf-8"))
-
-        name_length = min(len(seed_options["player_name"]), 0x10)
-        random.seed(seed_options["seed"] + seed_options["player"])
-        caller.patcher.dol.data.seek(0x1FF)
-        caller.patcher.dol.data.write(name_length.to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x200)
-        caller.patcher.dol.data.write(seed_options["player_name"].encode("utf-8")[0:name_length])
-        caller.patcher.dol.data.seek(0x210)
-        caller.patcher.dol.data.write(seed_options["seed_name"].encode("utf-8")[0:16])
-        caller.patcher.dol.data.seek(0x220)
-        caller.patcher.dol.data.write(seed_options.get("palace_stars", 7).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x221)
-        caller.patcher.dol.data.write(seed_options.get("starting_partner", 1).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x222)
-        caller.patcher.dol.data.write(seed_options.get("yoshi_color", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x223)
-        caller.patcher.dol.data.write((1).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x224)
-        caller.patcher.dol.data.write((0x80003260).to_bytes(4, "big"))
-        caller.patcher.dol.data.seek(0x229)
-        caller.patcher.dol.data.write(seed_options.get("palace_skip", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x22A)
-        caller.patcher.dol.data.write(seed_options.get("westside", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x22B)
-        caller.patcher.dol.data.write(seed_options.get("peekaboo", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x22C)
-        caller.patcher.dol.data.write(seed_options.get("intermissions", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x22D)
-        caller.patcher.dol.data.write(seed_options.get("starting_hp", 10).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x22E)
-        caller.patcher.dol.data.write(seed_options.get("starting_fp", 5).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x22F)
-        caller.patcher.dol.data.write(seed_options.get("starting_bp", 3).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x230)
-        caller.patcher.dol.data.write(seed_options.get("full_run_bar", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x231)
-        for star in seed_options.get("required_chapters", []):
-            caller.patcher.dol.data.write(star.to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x238)
-        caller.patcher.dol.data.write(seed_options.get("tattlesanity", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x239)
-        caller.patcher.dol.data.write(seed_options.get("fast_travel", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x23A)
-        caller.patcher.dol.data.write(seed_options.get("succeed_conditions", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x23C)
-        caller.patcher.dol.data.write(seed_options.get("cutscene_skip", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x23D)
-        caller.patcher.dol.data.write(seed_options.get("experience_multiplier", 1).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x23E)
-        caller.patcher.dol.data.write(seed_options.get("starting_level", 1).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x241)
-        caller.patcher.dol.data.write(seed_options.get("music", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x242)
-        caller.patcher.dol.data.write(seed_options.get("block_visibility", 1).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x243)
-        caller.patcher.dol.data.write(seed_options.get("first_attack", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x244)
-        caller.patcher.dol.data.write(random.randbytes(4))
-        caller.patcher.dol.data.seek(0x248)
-        caller.patcher.dol.data.write(seed_options.get("goal_stars", 7).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x249)
-        caller.patcher.dol.data.write(seed_options.get("goal", 1).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x24A)
-        caller.patcher.dol.data.write(seed_options.get("star_shuffle", 1).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x24B)
-        caller.patcher.dol.data.write(seed_options.get("dazzle_rewards", 3).to_bytes(1, "big"))
-        console = bool(seed_options.get("console_mode", 0))
-        caller.patcher.dol.data.seek(0x24C)
-        caller.patcher.dol.data.write((1 if console else 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x24D)
-        caller.patcher.dol.data.write(seed_options.get("shop_purchase_limit", 1).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x24E)
-        caller.patcher.dol.data.write(seed_options.get("grubba_bribe_direction", 2).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x24F)
-        caller.patcher.dol.data.write(seed_options.get("grubba_bribe_cost", 20).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x250)
-        caller.patcher.dol.data.write(seed_options.get("blue_pipe_toggle", 1).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x251)
-        caller.patcher.dol.data.write(seed_options.get("enemy_randomizer", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x252)
-        caller.patcher.dol.data.write(seed_options.get("enemy_stat_scaling", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x253)
-        caller.patcher.dol.data.write(seed_options.get("shuffle_chapter_stats", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x258)
-        caller.patcher.dol.data.write(seed_options.get("badge_bp", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x259)
-        caller.patcher.dol.data.write(seed_options.get("badge_fp", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x25A)
-        caller.patcher.dol.data.write(seed_options.get("partner_fp", 0).to_bytes(1, "big"))
-        caller.patcher.dol.data.seek(0x260)
-        caller.patcher.dol.data.write(seed_options.get("yoshi_name", "Yoshi").encode("utf-8")[0:8] + b"\x00")
-        caller.patcher.dol.data.seek(0xEB6B6)
-        caller.patcher.dol.data.write(int.to_bytes(seed_options.get("starting_coins", 100), 2, "big"))
-        caller.patcher.dol.data.seek(0x1888)
-        caller.patcher.dol.data.write(pkgutil.get_data(__name__, "data/US.bin"))
-        caller.patcher.dol.data.seek(0x6CE38)
-        caller.patcher.dol.data.write(int.to_bytes(0x4BF94A50, 4, "big"))
-        if not console:
-            caller.patcher.dol.data.seek(0x3C25FC)
-            caller.patcher.dol.data.write(int.to_bytes(0x33F4, 4, "big"))
-            caller.patcher.dol.data.seek(0x297FB4)
-            caller.patcher.dol.data.write(int.to_bytes(0x48000014, 4, "big"))
-            caller.patcher.dol.data.seek(0x297E74)
-            caller.patcher.dol.data.write(int.to_bytes(0x38A503FF, 4, "big"))
-            caller.patcher.dol.data.seek(0x2D368)
-            caller.patcher.dol.data.write(int.to_bytes(0x3C008200, 4, "big"))
-            caller.patcher.dol.data.write(int.to_bytes(0x901E0000, 4, "big"))
-            caller.patcher.dol.data.write(int.to_bytes(0x3C0083F0, 4, "big"))
-            caller.patcher.dol.data.write(int.to_bytes(0x901D0000, 4, "big"))
-            caller.patcher.dol.data.write(int.to_bytes(0x48000034, 4, "big"))
-            caller.patcher.dol.data.seek(0xDC7C)
-            caller.patcher.dol.data.write(int.to_bytes(0x3C800001, 4, "big"))
-            caller.patcher.dol.data.seek(0xDC90)
-            caller.patcher.dol.data.write(int.to_bytes(0x38804000, 4, "big"))
-            caller.patcher.dol.data.seek(0xDCA4)
-            caller.patcher.dol.data.write(int.to_bytes(0x3CA00001, 4, "big"))
-            caller.patcher.dol.data.seek(0xDCB4)
-            caller.patcher.dol.data.write(int.to_bytes(0x38A04000, 4, "big"))
-            caller.patcher.dol.data.seek(0x3E814)
-            caller.patcher.dol.data.write(int.to_bytes(0x3860FFFF, 4, "big"))
-            caller.patcher.dol.data.seek(0x3E818)
-            caller.patcher.dol.data.write(int.to_bytes(0x4800042C, 4, "big"))
-            caller.patcher.dol.data.seek(0x3F884)
-            caller.patcher.dol.data.write(int.to_bytes(0x38C00200, 4, "big"))
-            for _off in (0x3EF48, 0x3EFF8, 0x3F068, 0x3F118, 0x3F188, 0x3F238,
-                         0x3F2A8, 0x3F358, 0x3F3C4, 0x3F474, 0x3F4EC, 0x3F59C,
-                         0x3F60C, 0x3F6BC, 0x3F72C, 0x3F7DC, 0x3FD74, 0x3FE24):
-                caller.patcher.dol.data.seek(_off)
-                caller.patcher.dol.data.write(int.to_bytes(0x3C040040, 4, "big"))
-            caller.patcher.dol.data.seek(0x3FB18)
-            caller.patcher.dol.data.write(int.to_bytes(0x3C050040, 4, "big"))
-            for _off in (0x3F9B4, 0x3FB30, 0x3FE7C):
-                caller.patcher.dol.data.seek(_off)
-                caller.patcher.dol.data.write(int.to_bytes(0x3C800040, 4, "big"))
+        patches = [
+            (0xEB6B6, int.to_bytes(caller.options.starting_coins, 2, "big")),
+            (0x1888, bundled_payloads()["data/US.bin"]),
+            (0x6CE38, int.to_bytes(0x4BF94A50, 4, "big")),
+        ]
+        if not caller.options.console_mode:
+            patches += _EMULATOR_CODE_PATCHES
+        with caller.patcher.dol.data.getbuffer() as dol:
+            pack_ap_settings(dol, caller.options.to_dict())
+            for offset, data in _sorted_patches(patches):
+                dol[offset:offset + len(data)] = data
+        payloads = bundled_payloads()
         caller.patcher.iso.add_new_directory("files/mod")
         caller.patcher.iso.add_new_directory("files/mod/subrels")
         for file in [file for file in rel_filepaths if file != "mod"]:
-            caller.patcher.iso.add_new_file(f"files/mod/subrels/{file}.rel", io.BytesIO(pkgutil.get_data(__name__, f"data/{file}.rel")))
-        caller.patcher.iso.add_new_file("files/mod/mod.rel", io.BytesIO(pkgutil.get_data(__name__, f"data/mod.rel")))
-        caller.patcher.iso.add_new_file("files/mod/custom.rel", io.BytesIO(pkgutil.get_data(__name__, f"data/custom.rel")))
+            caller.patcher.iso.add_new_file(f"files/mod/subrels/{file}.rel", io.BytesIO(payloads[f"data/{file}.rel"]))
+        caller.patcher.iso.add_new_file("files/mod/mod.rel", io.BytesIO(payloads["data/mod.rel"]))
+        caller.patcher.iso.add_new_file("files/mod/custom.rel", io.BytesIO(payloads["data/custom.rel"]))
         caller.patcher.iso.add_new_file("files/mod/enemies.bin", io.BytesIO(caller.get_file("enemies.bin")))
-        caller.patcher.iso.add_new_file("files/msg/US/mod.txt", io.BytesIO(pkgutil.get_data(__name__, f"data/mod.txt")))
+        if "enemies_v2.bin" in caller.files:
+            caller.patcher.iso.add_new_file("files/mod/enemies_v2.bin", io.BytesIO(caller.get_file("enemies_v2.bin")))
+        caller.patcher.iso.add_new_file("files/msg/US/mod.txt", io.BytesIO(payloads["data/mod.txt"]))
         caller.patcher.iso.add_new_file("files/msg/US/desc.txt", io.BytesIO(caller.get_file("desc.txt")))
 
 
 
     @staticmethod
     def close_iso(caller: "TTYDProcedurePatch") -> None:
-        for rel in caller.patcher.rels.keys():
-            caller.patcher.iso.changed_files[get_rel_path(rel)] = caller.patcher.rels[rel]
+        for rel, data in caller.patcher.rels.items():
+            caller.patcher.iso.changed_files[get_rel_path(rel)] = data
         caller.patcher.iso.changed_files["sys/main.dol"] = caller.patcher.dol.data
-        for _,_ in caller.patcher.iso.export_disc_to_iso_with_changed_files(caller.file_path):
+        manifest = build_manifest(caller.patcher.iso.changed_files, base_hash=caller.hash,
+                                  world_version=get_world_version(), patch_key=caller.content_key())
+        if caller.overlay:
+            export = caller.patcher.iso.export_overlay(caller.file_path)
+        else:
+            export = caller.patcher.iso.export_disc_to_iso_with_changed_files(caller.file_path)
+        for _,_ in export:
             continue
+        write_manifest(manifest_path_for(caller.file_path), manifest)
+        caller.patcher.close()
 
     @staticmethod
     def patch_icon(caller: "TTYDProcedurePatch") -> None:
-        icon_patch = pkgutil.get_data(__name__, f"data/icon.bsdiff4")
-        bin_patch = pkgutil.get_data(__name__, f"data/icon_bin.bsdiff4")
-        icon_file = caller.patcher.iso.read_file_data("files/icon.tpl")
-        bin_file = caller.patcher.iso.read_file_data("files/icon.bin")
-        icon_file.seek(0)
-        original_icon_data = icon_file.read()
-        bin_file.seek(0)
-        original_bin_data = bin_file.read()
-        patched_icon_data = bsdiff4.patch(original_icon_data, icon_patch)
-        patched_bin_data = bsdiff4.patch(original_bin_data, bin_patch)
+        icon_patch = bundled_payloads()["data/icon.bsdiff4"]
+        bin_patch = bundled_payloads()["data/icon_bin.bsdiff4"]
+        patched_icon_data = caller.patcher.assets.derived(
+            "files/icon.tpl", icon_patch, lambda: bsdiff4.patch(caller.patcher.read_pristine("files/icon.tpl"), icon_patch))
+        patched_bin_data = caller.patcher.assets.derived(
+            "files/icon.bin", bin_patch, lambda: bsdiff4.patch(caller.patcher.read_pristine("files/icon.bin"), bin_patch))
         new_icon_file = io.BytesIO(patched_icon_data)
         new_bin_file = io.BytesIO(patched_bin_data)
         caller.patcher.iso.changed_files["files/icon.tpl"] = new_icon_file
@@ -220,54 +274,93 @@ class TTYDPatchExtension(APPatchExtension):
 
     @staticmethod
     def patch_items(caller: "TTYDProcedurePatch") -> None:
-        from CommonClient import logger
-        locations: Dict[str, Tuple] = json.loads(caller.get_file(f"locations.json").decode("utf-8"))
-        seed_options = json.loads(caller.get_file("options.json").decode("utf-8"))
-        for location_name, (item_id, player, shop_price) in locations.items():
-            data = locationName_to_data.get(location_name, None)
-            if data is None:
-                continue
-            if data.offset or "Tattle" in location_name:
-                if player != caller.player:
-                    item_data = ItemData(id=0, item_name="", progression="filler", rom_id=0x71)
-                    rom_id = item_data.rom_id
-                else:
-                    item_data = items_by_id.get(item_id, ItemData(id=0, item_name="", progression="filler", rom_id=0x0))
-                    rom_id = item_data.rom_id
-                    if seed_options.get("remote_items", 0) == 1 and rom_id != 0:
-                        is_shop = data.id in shop_items
-                        repurchasable = is_shop and _is_infinitely_repurchasable(
-                            rom_id,
-                            seed_options.get("shop_purchase_limit", _SHOP_LIMIT_CONSUMABLES),
-                            item_data.progression)
-                        if not repurchasable:
-                            rom_id = 0x71
-                if rom_id == 0:
-                    logger.error(f"Item {item_data.item_name} not found in item_type_dict")
-                if data.rel == Rels.dol:
-                    if "Tattle" in location_name:
-                        for unit_id in location_to_unit[location_table[location_name]]:
-                            logger.info(f"Writing Tattle item {item_data.item_name} to unit {unit_id}")
-                            caller.patcher.dol.data.seek(0xB00 + ((unit_id - 1) * 2))
-                            caller.patcher.dol.data.write(rom_id.to_bytes(2, "big"))
-                        continue
-                    if "Dazzle" in location_name:
-                        caller.patcher.dol.data.seek(data.offset[0])
-                        caller.patcher.dol.data.write(rom_id.to_bytes(2, "big"))
-                else:
-                    for i, offset in enumerate(data.offset):
-                        if "30 Coins" in data.name and i == 1:
-                            caller.patcher.rels[Rels.pik].seek(offset)
-                            caller.patcher.rels[Rels.pik].write(rom_id.to_bytes(4, "big"))
-                            continue
-                        caller.patcher.rels[data.rel].seek(offset)
-                        caller.patcher.rels[data.rel].write(rom_id.to_bytes(4, "big"))
-                        if data.id in shop_items:
-                            caller.patcher.rels[data.rel].seek(offset + 4)
-                            if rom_id == 0x71:
-                                caller.patcher.rels[data.rel].write(int.to_bytes(20, 4, "big"))
-                            else:
-                                caller.patcher.rels[data.rel].write(int.to_bytes(shop_price, 4, "big"))
+        if "writes.bin" in caller.files:
+            plan = caller.get_file("writes.bin")
+        else:
+            # Patches from before writes.bin: build the plan from the placed locations now
+            from CommonClient import logger
+            plan = build_write_plan(read_locations(caller), caller.player, caller.options.remote_items == 1,
+                                    caller.options.shop_purchase_limit, logger.error)
+
+        for rel, writes in read_write_plan(plan).items():
+            data = caller.patcher.dol.data if rel == Rels.dol else caller.patcher.get_rel(rel)
+            with data.getbuffer() as view:
+                for offset, value in writes:
+                    view[offset:offset + len(value)] = value
+
+
+BUNDLED_PAYLOADS = tuple(f"data/{file}.rel" for file in rel_filepaths if file != "mod") + (
+    "data/mod.rel", "data/custom.rel", "data/mod.txt", "data/US.bin", "data/icon.bsdiff4", "data/icon_bin.bsdiff4")
+
+
+@lru_cache(maxsize=1)
+def bundled_payloads() -> Dict[str, bytes]:
+    """
+    The data files the patch steps copy into the iso, read once per process. From an .apworld they
+    come out of one pass over a single ZipFile instead of a pkgutil.get_data call per file.
+    """
+    base_path = os.path.dirname(__file__)
+    zip_file_path = find_apworld()
+    if zip_file_path is None:
+        payloads = {}
+        for name in BUNDLED_PAYLOADS:
+            with open(os.path.join(base_path, name), "rb") as f:
+                payloads[name] = f.read()
+        return payloads
+    prefix = os.path.relpath(base_path, zip_file_path).replace(os.sep, "/")
+    with zipfile.ZipFile(zip_file_path, "r") as zip_ref:
+        return {name: zip_ref.read(f"{prefix}/{name}") for name in BUNDLED_PAYLOADS}
+
+
+DESC_SIZE = 0x1000
+
+# Message key and location id of every shop slot, six per shop in shop_names order
+SHOP_SLOTS = [(f"ap_{shop_names[i // 6]}_{i % 6}", location_id) for i, location_id in enumerate(shop_items)]
+
+
+def _shorten(text: str, limit: Optional[int]) -> str:
+    if limit is None or len(text) <= limit:
+        return text
+    text = text[:limit]
+    # sanitize_string doubles backslashes; never keep half of an escaped pair
+    if (len(text) - len(text.rstrip("\\"))) % 2:
+        text = text[:-1]
+    return text
+
+
+def _shop_table(entries: List[Tuple[str, str, str, ItemClassification]], limit: Optional[int] = None) -> bytes:
+    table = "".join(f"{key}\x00{_shorten(player_name, limit)}'s\n<col {classification_to_color(classification)}ff>"
+                    f"{_shorten(item_name, limit)}</col>\x00"
+                    for key, player_name, item_name, classification in entries)
+    # An extra null terminates the table
+    return (table + "\x00").encode("utf-8")
+
+
+def build_shop_descriptions(entries: Iterable[Tuple[str, str, str, ItemClassification]]) -> bytes:
+    """
+    desc.txt: null separated message key / text pairs for the shop slots, padded to DESC_SIZE. Names too long
+    for the budget are cut to the longest length that still fits, so other games' long names don't fail the seed.
+    """
+    entries = list(entries)
+    data = _shop_table(entries)
+    if len(data) > DESC_SIZE:
+        longest = max((max(len(player_name), len(item_name)) for _, player_name, item_name, _ in entries), default=0)
+        lo, hi = 0, longest
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if len(_shop_table(entries, mid)) <= DESC_SIZE:
+                lo = mid
+            else:
+                hi = mid - 1
+        shortened = _shop_table(entries, lo)
+        if len(shortened) > DESC_SIZE:
+            raise Exception(f"Shop descriptions take {len(shortened):#x} bytes even without names, more than the "
+                            f"{DESC_SIZE:#x} bytes reserved for desc.txt")
+        logging.warning(f"Shop descriptions take {len(data):#x} bytes, more than the {DESC_SIZE:#x} bytes reserved "
+                        f"for desc.txt; player and item names in shops are cut to {lo} characters")
+        data = shortened
+    return data + bytes(DESC_SIZE - len(data))
+
 
 def get_rel_path(rel: Rels):
     return f'files/rel/{rel.value}.rel'
@@ -280,6 +373,16 @@ class TTYDProcedurePatch(APProcedurePatch, APTokenMixin):
     result_file_ending = ".iso"
     file_path: str = ""
     patcher: "TTYDPatcher"
+    streaming: Optional[bool] = None
+    base_iso: Optional[StreamingGCM] = None
+    assets: Optional[PristineAssetCache] = None
+    use_cache: bool = True
+    overlay: bool = False
+    options: Optional[PatchOptions] = None
+    # Called with (step name, steps done, step count) after each procedure step
+    progress: Optional[Callable[[str, int, int], None]] = None
+    # Called with (bytes hashed, total) while the base iso is checked, when it has to be
+    hash_progress: Optional[Callable[[int, int], None]] = None
 
     procedure = [
         ("patch_mod", []),
@@ -288,13 +391,35 @@ class TTYDProcedurePatch(APProcedurePatch, APTokenMixin):
         ("close_iso", [])
     ]
 
+    def content_key(self) -> str:
+        """Identifies the patched iso this patch produces; read() must have been called."""
+        return cache_key(self.hash, get_world_version(), [self.files.get(name) for name in CACHE_MEMBERS])
+
     def patch(self, target) -> None:
-        self.patcher = TTYDPatcher()
+        from settings import get_settings
         self.file_path = target
         self.read()
+        # Overlay output leaves only the changed extents next to the target; console players need the full iso.
+        self.options = load_patch_options(self.get_file("options.json"))
+        self.overlay = bool(get_settings().ttyd_options.overlay_output) and not self.options.console_mode
+        cache = get_patched_iso_cache() if self.use_cache and not self.overlay else None
+        key = self.content_key()
+        manifest = manifest_path_for(target)
+        remove_output(manifest)
+        if cache is not None and cache.fetch(key, target, manifest):
+            return
+        if self.overlay:
+            # An iso already rebuilt from an earlier overlay is kept; the client reuses it if it still matches the manifest.
+            self.file_path = overlay_path_for(target)
+        else:
+            remove_output(target)
+        rom_file = self.base_iso.iso_path if self.base_iso is not None else get_settings().ttyd_options.rom_file
+        validate_base_iso(rom_file, self.hash, get_verified_iso_cache(), self.hash_progress)
+        iso = self.base_iso.clone() if self.base_iso is not None else None
+        self.patcher = TTYDPatcher(self.hash, True if self.overlay else self.streaming, iso, self.assets)
         patch_extender = AutoPatchExtensionRegister.get_handler(self.game)
         assert not isinstance(self.procedure, str), f"{type(self)} must define procedures"
-        for step, args in self.procedure:
+        for index, (step, args) in enumerate(self.procedure):
             if isinstance(patch_extender, list):
                 extension = next((item for item in [getattr(extender, step, None) for extender in patch_extender]
                                   if item is not None), None)
@@ -302,8 +427,27 @@ class TTYDProcedurePatch(APProcedurePatch, APTokenMixin):
                 extension = getattr(patch_extender, step, None)
             if extension is not None:
                 extension(self, *args)
+            if self.progress is not None:
+                self.progress(step, index + 1, len(self.procedure))
+        if cache is not None:
+            cache.store(key, target, manifest)
 
-def write_files(world: "TTYDWorld", patch: TTYDProcedurePatch) -> None:
+
+def get_patched_iso_cache() -> Optional[PatchedIsoCache]:
+    from settings import get_settings
+    from Utils import cache_path
+    max_size = int(get_settings().ttyd_options.patch_cache_size) * 1024 * 1024
+    if max_size <= 0:
+        return None
+    return PatchedIsoCache(cache_path("ttyd", "patched_isos"), max_size)
+
+
+def get_verified_iso_cache() -> VerifiedIsoCache:
+    from Utils import cache_path
+    return VerifiedIsoCache(cache_path("ttyd", "verified_isos.json"))
+
+
+def get_world_version() -> str:
     manifest_data = pkgutil.get_data(__name__, "archipelago.json")
     if manifest_data is None:
         raise Exception("TTYD APWorld is missing manifest file (archipelago.json)")
@@ -311,80 +455,110 @@ def write_files(world: "TTYDWorld", patch: TTYDProcedurePatch) -> None:
     world_version = manifest.get("world_version")
     if world_version is None:
         raise Exception("TTYD APWorld manifest is missing world_version")
+    return world_version
+
+
+class PatchSnapshot(NamedTuple):
+    player: int
+    player_name: str
+    out_file_name_base: str
+    options: PatchOptions
+    locations: Tuple[Tuple[int, int, int, int], ...]
+    shop_entries: Tuple[Tuple[str, str, str, ItemClassification], ...]
+    encounters: Tuple[Encounter, ...]
 
-    options_dict = {
-        "world_version": world_version,
-        "seed": world.multiworld.seed,
-        "seed_name": world.multiworld.seed_name,
-        "player": world.player,
-        "player_name": world.multiworld.player_name[world.player],
-        "yoshi_name": world.options.yoshi_name.value,
-        "yoshi_color": world.options.yoshi_color.value,
-        "starting_partner": world.options.starting_partner.value,
-        "palace_stars": world.options.palace_stars.value,
-        "goal_stars": world.options.goal_stars.value,
-        "starting_coins": world.options.starting_coins.value,
-        "palace_skip": world.options.palace_skip.value,
-        "westside": world.options.open_westside.value,
-        "peekaboo": world.options.permanent_peekaboo.value,
-        "intermissions": world.options.disable_intermissions.value,
-        "starting_hp": world.options.starting_hp.value,
-        "starting_fp": world.options.starting_fp.value,
-        "starting_bp": world.options.starting_bp.value,
-        "full_run_bar": world.options.full_run_bar.value,
-        "required_chapters": world.required_chapters,
-        "tattlesanity": world.options.tattlesanity.value,
-        "fast_travel": world.options.fast_travel.value,
-        "succeed_conditions": world.options.succeed_conditions.value,
-        "cutscene_skip": world.options.cutscene_skip.value,
-        "experience_multiplier": world.options.experience_multiplier.value,
-        "starting_level": world.options.starting_level.value,
-        "first_attack": world.options.first_attack.value,
-        "music": world.options.music_settings.value,
-        "block_visibility": world.options.block_visibility.value,
-        "goal": world.options.goal.value,
-        "star_shuffle": world.options.star_shuffle.value,
-        "dazzle_rewards": world.options.dazzle_rewards.value,
-        "shop_purchase_limit": world.options.shop_purchase_limit.value,
-        "grubba_bribe_direction": world.options.grubba_bribe_direction.value,
-        "grubba_bribe_cost": world.options.grubba_bribe_cost.value,
-        "blue_pipe_toggle": world.options.blue_pipe_toggle.value,
-        "enemy_randomizer": world.options.enemy_randomizer.value,
-        "enemy_stat_scaling": world.options.enemy_stat_scaling.value,
-        "shuffle_chapter_stats": world.options.shuffle_chapter_stats.value,
-        "badge_bp": world.options.badge_bp.value,
-        "badge_fp": world.options.badge_fp.value,
-        "partner_fp": world.options.partner_fp.value,
-        "console_mode": world.options.console_mode.value,
-        "remote_items": world.options.remote_items.value
-    }
-
-    buffer = io.BytesIO()
-    for i in range(len(shop_items)):
-        location = world.get_location(location_id_to_name[shop_items[i]])
+
+def snapshot_patch_data(world: "TTYDWorld") -> PatchSnapshot:
+    """
+    Everything the patch files are built from, copied out of the world. The snapshot holds no reference
+    to the multiworld, so write_snapshot can run on any thread while generation carries on.
+    """
+    world_version = get_world_version()
+
+    options = PatchOptions(
+        world_version=world_version,
+        seed=world.multiworld.seed,
+        seed_name=world.multiworld.seed_name,
+        player=world.player,
+        player_name=world.multiworld.player_name[world.player],
+        yoshi_name=world.options.yoshi_name.value,
+        yoshi_color=world.options.yoshi_color.value,
+        starting_partner=world.options.starting_partner.value,
+        palace_stars=world.options.palace_stars.value,
+        goal_stars=world.options.goal_stars.value,
+        starting_coins=world.options.starting_coins.value,
+        palace_skip=world.options.palace_skip.value,
+        westside=world.options.open_westside.value,
+        peekaboo=world.options.permanent_peekaboo.value,
+        intermissions=world.options.disable_intermissions.value,
+        starting_hp=world.options.starting_hp.value,
+        starting_fp=world.options.starting_fp.value,
+        starting_bp=world.options.starting_bp.value,
+        full_run_bar=world.options.full_run_bar.value,
+        required_chapters=tuple(world.required_chapters),
+        tattlesanity=world.options.tattlesanity.value,
+        fast_travel=world.options.fast_travel.value,
+        succeed_conditions=world.options.succeed_conditions.value,
+        cutscene_skip=world.options.cutscene_skip.value,
+        experience_multiplier=world.options.experience_multiplier.value,
+        starting_level=world.options.starting_level.value,
+        first_attack=world.options.first_attack.value,
+        music=world.options.music_settings.value,
+        block_visibility=world.options.block_visibility.value,
+        goal=world.options.goal.value,
+        star_shuffle=world.options.star_shuffle.value,
+        dazzle_rewards=world.options.dazzle_rewards.value,
+        shop_purchase_limit=world.options.shop_purchase_limit.value,
+        grubba_bribe_direction=world.options.grubba_bribe_direction.value,
+        grubba_bribe_cost=world.options.grubba_bribe_cost.value,
+        blue_pipe_toggle=world.options.blue_pipe_toggle.value,
+        enemy_randomizer=world.options.enemy_randomizer.value,
+        enemy_stat_scaling=world.options.enemy_stat_scaling.value,
+        shuffle_chapter_stats=world.options.shuffle_chapter_stats.value,
+        badge_bp=world.options.badge_bp.value,
+        badge_fp=world.options.badge_fp.value,
+        partner_fp=world.options.partner_fp.value,
+        console_mode=world.options.console_mode.value,
+        remote_items=world.options.remote_items.value,
+    )
+
+    shop_ids = rel_write_records().shop_ids
+    shop_locations = {location.address: location for location in world.multiworld.get_locations(world.player)
+                      if location.address in shop_ids}
+    entries = []
+    for key, location_id in SHOP_SLOTS:
+        location = shop_locations[location_id]
         player_name = sanitize_string(world.multiworld.player_name[location.item.player]) if location.item is not None else "Unknown Player"
-        item_name = sanitize_string(location.item.name)
-        buffer.write(f"ap_{shop_names[i // 6]}_{i % 6}".encode('utf-8'))
-        buffer.write(b'\x00')
-        buffer.write(f"{player_name}'s\n<col {classification_to_color(location.item.classification)}ff>{item_name}</col>".encode('utf-8'))
-        buffer.write(b'\x00')
-    buffer.write(b'\x00')  # null terminator for the end of the table
-
-    enemy_buffer = io.BytesIO()
-    encounters = world.encounters
-    enemy_buffer.write(struct.pack(">H", len(encounters)))
-    for entry in encounters:
-        ids = entry.enemy_ids
-        enemy_buffer.write(struct.pack("B", len(ids)))
-        for eid in ids:
-            enemy_buffer.write(struct.pack("B", eid))
-
-    max_desc_size = 0x1000
-    desc_data = buffer.getvalue()
-    patch.write_file("desc.txt", desc_data + b'\x00' * (max_desc_size - len(desc_data)))
-    patch.write_file("options.json", json.dumps(options_dict).encode("UTF-8"))
-    patch.write_file(f"locations.json", json.dumps(locations_to_dict(world.multiworld.get_locations(world.player))).encode("UTF-8"))
-    patch.write_file("enemies.bin", enemy_buffer.getvalue())
+        entries.append((key, player_name, sanitize_string(location.item.name), location.item.classification))
+    return PatchSnapshot(world.player, world.multiworld.player_name[world.player],
+                         world.multiworld.get_out_file_name_base(world.player), options,
+                         tuple(location_records(world.multiworld.get_locations(world.player))),
+                         tuple(entries), tuple(world.encounters))
+
+
+def write_snapshot(snapshot: PatchSnapshot, patch: TTYDProcedurePatch) -> None:
+    patch.write_file("desc.txt", build_shop_descriptions(snapshot.shop_entries))
+    patch.write_file("options.json", snapshot.options.encode())
+    patch.write_file("locations.bin", pack_locations(snapshot.locations))
+    patch.write_file("writes.bin", build_write_plan(snapshot.locations, snapshot.player,
+                                                    snapshot.options.remote_items == 1,
+                                                    snapshot.options.shop_purchase_limit, logging.error))
+    patch.write_file("enemies.bin", pack_encounters_v1(list(snapshot.encounters)))
+    patch.write_file("enemies_v2.bin", pack_encounters_v2(list(snapshot.encounters)))
+
+
+def write_files(world: "TTYDWorld", patch: TTYDProcedurePatch) -> None:
+    write_snapshot(snapshot_patch_data(world), patch)
+
+
+def write_patch(snapshot: PatchSnapshot, output_directory: str) -> str:
+    """Builds and writes one slot's .apttyd. Touches nothing but the snapshot, so slots can run in parallel."""
+    patch = TTYDProcedurePatch(player=snapshot.player, player_name=snapshot.player_name)
+    write_snapshot(snapshot, patch)
+    rom_path = os.path.join(output_directory, f"{snapshot.out_file_name_base}{patch.patch_file_ending}")
+    patch.write(rom_path)
+    return rom_path
+
 
 def classification_to_color(classification: ItemClassification = ItemClassification.filler) -> str:
     if classification & ItemClassification.progression:
@@ -397,22 +571,47 @@ def classification_to_color(classification: ItemClassification = ItemClassificat
         return "005858"
 
 
-def locations_to_dict(locations: Iterable[Location]) -> Dict[str, Tuple]:
-    result = {}
+def location_records(locations: Iterable[Location]) -> Iterable[Tuple[int, int, int, int]]:
+    """(location id, item code, item player, shop price) for every location with an address."""
+    shop_ids = rel_write_records().shop_ids
     for location in locations:
+        if location.address is None:
+            continue
         if location.item is not None:
-            item_code = location.item.code
-            item_player = location.item.player
+            item_code = location.item.code or 0
             # Add shop price if this location is a shop item
-            is_shop = locationName_to_data[location.name].id in shop_items
-            shop_price = item_prices.get(item_code, 10) if is_shop else 10
-            result[location.name] = (item_code, item_player, shop_price)
+            shop_price = item_prices.get(item_code, 10) if location.address in shop_ids else 10
+            yield location.address, item_code, location.item.player, shop_price
         else:
-            result[location.name] = (0, 0, 0)
-    return result
+            yield location.address, 0, 0, 0
+
+
+def pack_locations(records: Iterable[Tuple[int, int, int, int]]) -> bytes:
+    """
+    locations.bin: a header (magic, version, record count) followed by one fixed-size
+    (location id, item code, item player, shop price) record per location_records entry.
+    """
+    packed = [_LOCATION_RECORD.pack(*record) for record in records]
+    return _LOCATIONS_HEADER.pack(LOCATIONS_BIN_MAGIC, LOCATIONS_BIN_VERSION, len(packed)) + b"".join(packed)
+
+
+def read_locations(caller: "TTYDProcedurePatch") -> Iterable[Tuple[int, int, int, int]]:
+    """(location id, item code, item player, shop price) for every location in the patch."""
+    if "locations.bin" not in caller.files:
+        # Patches from before locations.bin carry a name-keyed locations.json instead
+        locations: Dict[str, Tuple] = json.loads(caller.get_file("locations.json").decode("utf-8"))
+        return [(locationName_to_data[name].id, item_code, player, shop_price)
+                for name, (item_code, player, shop_price) in locations.items() if name in locationName_to_data]
+    data = caller.get_file("locations.bin")
+    magic, version, count = _LOCATIONS_HEADER.unpack_from(data)
+    if magic != LOCATIONS_BIN_MAGIC or version != LOCATIONS_BIN_VERSION:
+        raise Exception(f"Unsupported locations.bin (magic {magic!r}, version {version})")
+    end = _LOCATIONS_HEADER.size + count * _LOCATION_RECORD.size
+    return _LOCATION_RECORD.iter_unpack(memoryview(data)[_LOCATIONS_HEADER.size:end])
+
+_ALLOWED_CHARS = frozenset(' !"#$%&\'()=~|-^\\[]P{};:+*/?_,.@`abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789‘’‚“”„Œœ¡¤ª«²³º»¼½¾¿ÀÁÂÄÇÈÉÊËÌÍÎÏÐÑÒÓÔÖ×ØÙÚÛÜÞßàáâäçèéêëìíîïñòóôöùúûü')
+
 
 def sanitize_string(input_string) -> str:
     input_string = input_string.replace('\\', '\\\\') # Use the built in heart symbol and make sure escape sequences don't happen
-    allowed_chars = ' !"#$%&\'()=~|-^\\[]P{};:+*/?_,.@`abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789‘’‚“”„Œœ¡¤ª«²³º»¼½¾¿ÀÁÂÄÇÈÉÊËÌÍÎÏÐÑÒÓÔÖ×ØÙÚÛÜÞßàáâäçèéêëìíîïñòóôöùúûü'
-    filtered_chars = [char for char in input_string if char in allowed_chars]
-    return "".join(filtered_chars)
+    return "".join(filter(_ALLOWED_CHARS.__contains__, input_string))
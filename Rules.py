@@ -3,7 +3,7 @@ import pkgutil
 import typing
 
 from worlds.generic.Rules import add_rule, forbid_items_for_player
-from . import StateLogic, location_table, EnemyRandomizer
+from . import StateLogic, location_table
 from .Options import Goal, PitItems
 from .Data import stars, pit_exclusive_tattle_stars_required, location_to_unit
 from .Locations import get_location_ids, get_locations_by_tags, location_id_to_name
@@ -37,10 +37,7 @@ def set_tattle_rules(world: "TTYDWorld"):
         if location.name in world.disabled_locations:
             continue
         add_rule(world.get_location(location.name), lambda state: state.has("Goombella", world.player))
-    rules_dict = get_random_enemy_tattle_rules_dict(world) \
-        if world.options.enemy_randomizer != EnemyRandomizer.option_vanilla \
-        else get_tattle_rules_dict()
-    for location_name, locations in rules_dict.items():
+    for location_name, locations in world.tattle_rules.items():
         if location_name in world.disabled_locations:
             continue
         if len(locations) == 0:
@@ -269,25 +266,19 @@ def get_tattle_rules_dict() -> dict[str, typing.List[int]]:
 
 def get_random_enemy_tattle_rules_dict(world: "TTYDWorld") -> dict[str, list[int]]:
     base_rules = get_tattle_rules_dict()
-
-    encounter_enemy_sets = [
-        (enc.location_id, set(enc.enemy_ids))
-        for enc in world.encounters
-    ]
-
     result: dict[str, list[int]] = {}
 
     for key in base_rules:
-        tattle_ids = set(location_to_unit[location_table[key]])  # <-- FIX
-
-        matching_locations = [
-            loc_id
-            for loc_id, enemy_set in encounter_enemy_sets
-            if enemy_set & tattle_ids
-        ]
+        tattle_ids = location_to_unit[location_table[key]]
 
-        # fallback to base rule if random finds nothing
-        result[key] = matching_locations if matching_locations else list(base_rules[key])
+        if any(_id in world.enemy_locations for _id in tattle_ids):
+            # every shuffled enemy is guaranteed a placement, so the rule is exactly where it landed
+            result[key] = list(dict.fromkeys(
+                loc_id for _id in tattle_ids for loc_id in world.enemy_locations.get(_id, ())
+            ))
+        else:
+            # enemies outside the encounter pool (bosses, scripted fights) never move
+            result[key] = list(base_rules[key])
 
         if key == "Tattle: Mini-Yux":
             result[key] = result["Tattle: Yux"]
@@ -297,4 +288,3 @@ def get_random_enemy_tattle_rules_dict(world: "TTYDWorld") -> dict[str, list[int
             result[key] = result["Tattle: X-Yux"]
 
     return result
-
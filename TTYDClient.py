@@ -11,18 +11,21 @@ import dolphin_memory_engine_ttyd as dolphin
 TTYDPatcher.dolphin = dolphin
 
 import asyncio
+import os
 import struct
 import subprocess
 import traceback
 import typing
 import settings
-import Patch
 import Utils
 from CommonClient import ClientCommandProcessor, get_base_parser, gui_enabled, logger, server_loop
 from NetUtils import NetworkItem, ClientStatus
 from . import Ghosts
 from .Data import location_gsw_info, location_to_unit, GSWType
 from .Items import items_by_id
+from .Disc import apply_overlay, manifest_path_for, overlay_path_for, read_manifest, verify_disc
+from .APSettings import AP_SETTINGS_RAM_BASE, AP_SETTINGS_START, AP_SETTINGS_SIZE, validate_ap_settings
+from .PatchOptions import PatchOptions, read_patch_options
 
 from .ttyd_runtime import (
     _on_ghost_disconnect,
@@ -605,10 +608,67 @@ async def _run_game(rom: str):
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
         )
+def _prepare_game(patch_file: str, log: typing.Callable[[str], None]) -> str:
+    """Patches the base iso unless the iso from an earlier launch still matches; runs in a worker thread."""
+    from .PatchCache import remove_output
+    from .Rom import TTYDProcedurePatch
+    rom_file = settings.get_settings().ttyd_options.rom_file
+    reported = [-10]
+
+    def hash_progress(done: int, total: int) -> None:
+        percent = done * 100 // total
+        if percent >= reported[0] + 10:
+            reported[0] = percent
+            log(f"Checking base iso... {percent}%")
+
+    # Same as Patch.create_rom_file, with progress hooks on the procedure and the base iso check
+    patch = TTYDProcedurePatch(path=patch_file)
+    patch.progress = lambda step, done, count: log(f"Patching iso... {done}/{count} ({step})")
+    patch.hash_progress = hash_progress
+    output_file = os.path.splitext(patch_file)[0] + patch.result_file_ending
+    patch.read()
+    key = patch.content_key()
+    # A relaunch finds the iso it built last time; the base iso is only checked when patching actually runs
+    if _patched_iso_matches(output_file, key):
+        return output_file
+    patch.patch(output_file)
+
+    overlay = overlay_path_for(output_file)
+    if os.path.exists(overlay) and not _patched_iso_matches(output_file, key):
+        # A full copy of the base iso unless the filesystem can reflink it
+        log("Building the iso from the patch overlay...")
+        remove_output(output_file)
+        for _ in apply_overlay(rom_file, overlay, output_file):
+            continue
+    return output_file
+
+
+def _patched_iso_matches(iso_file: str, patch_key: str) -> bool:
+    """Whether an iso built for the patch with this content key is already there with every file its manifest lists."""
+    manifest_path = manifest_path_for(iso_file)
+    if not os.path.exists(iso_file) or not os.path.exists(manifest_path):
+        return False
+    try:
+        manifest = read_manifest(manifest_path)
+        return manifest.get("patch_key") == patch_key and not verify_disc(iso_file, manifest)
+    except Exception:
+        return False
+
+
 async def _patch_and_run_game(patch_file: str):
-    metadata, output_file = Patch.create_rom_file(patch_file)
-    Utils.async_start(_run_game(output_file))
-    return metadata
+    """Patches in a worker thread so the client keeps running, then launches Dolphin once the iso is ready."""
+    loop = asyncio.get_running_loop()
+
+    def log(message: str) -> None:
+        loop.call_soon_threadsafe(logger.info, message)
+
+    try:
+        output_file = await loop.run_in_executor(None, _prepare_game, patch_file, log)
+    except Exception:
+        logger.exception("Patching failed; Dolphin was not launched.")
+        return
+    logger.info(f"Patched iso ready at {output_file}")
+    await _run_game(output_file)
 
 def _installed_world_version():
     """world_version of the apworld currently running this client."""
@@ -623,19 +683,20 @@ def _installed_world_version():
         return None
 
 
-def _patch_world_version(patch_file: str):
-    """world_version that was baked into the patch's options.json at generation.
-    The .apttyd is a zip archive; read the member directly without patching."""
-    import zipfile
-    import json
+def _patch_options(patch_file: str):
+    """PatchOptions that were baked into the patch at generation, read without patching."""
     try:
-        with zipfile.ZipFile(patch_file) as zf:
-            with zf.open("options.json") as f:
-                return json.loads(f.read().decode("utf-8")).get("world_version")
+        return read_patch_options(patch_file)
     except Exception:
         return None
 
 
+def verify_rom_settings(options: PatchOptions) -> list:
+    """Reads the whole APSettings block from RAM and returns the settings that differ from the patch."""
+    block = dolphin.read_bytes(AP_SETTINGS_RAM_BASE + AP_SETTINGS_START, AP_SETTINGS_SIZE)
+    return validate_ap_settings(block, options.to_dict())
+
+
 async def ttyd_sync_task(ctx: TTYDContext):
     if getattr(ctx, "patch_provided", False):
         patch_version = getattr(ctx, "patch_world_version", None)
@@ -685,6 +746,10 @@ async def ttyd_sync_task(ctx: TTYDContext):
                             continue
                         ctx.seed_verified = True
                         logger.info("ROM Seed verified successfully.")
+                        if getattr(ctx, "patch_options", None):
+                            mismatched = verify_rom_settings(ctx.patch_options)
+                            if mismatched:
+                                logger.warning(f"ROM settings do not match the patch file: {', '.join(mismatched)}")
                     if "DeathLink" in ctx.tags:
                         await ctx.check_death()
                     if not ctx.save_loaded():
@@ -766,13 +831,16 @@ def launch(*args):
             _apply_dolphin_game_settings(settings.get_settings().ttyd_options.dolphin_path)
         except Exception:
             pass
-        if args.patch_file:
-            await asyncio.create_task(_patch_and_run_game(args.patch_file))
         ctx = TTYDContext(args.connect, args.password)
         ctx.patch_world_version = None
+        ctx.patch_options = None
         ctx.patch_provided = bool(args.patch_file)
         if args.patch_file:
-            ctx.patch_world_version = _patch_world_version(args.patch_file)
+            ctx.patch_options = _patch_options(args.patch_file)
+            if ctx.patch_options is not None:
+                ctx.patch_world_version = ctx.patch_options.world_version
+            # Runs alongside the server connection and the Dolphin connector, which keeps retrying until the game is up
+            ctx.patch_task = asyncio.create_task(_patch_and_run_game(args.patch_file), name="PatchAndRun")
         ctx.server_task = asyncio.create_task(server_loop(ctx), name="ServerLoop")
         if gui_enabled:
             if tracker_loaded:
@@ -1,59 +1,47 @@
+import hashlib
 import io
 import os
+import shutil
 import sys
 import tempfile
 import zipfile
 
-from typing import Dict
+from typing import Dict, Optional
 from settings import get_settings
+from Utils import cache_path
 from .Data import Rels
+from .Disc import StreamingGCM
+from .PatchCache import PristineAssetCache, iso_fingerprint
 
 
-def setup_gclib_path():
-    """Extracts gclib files from .apworld zip to temp directory if needed."""
-    base_path = os.path.dirname(__file__)
-    lib_path = os.path.join(base_path, "lib", "gclib")
-
-    if ".apworld" in __file__:
-        # Find the .apworld file path
-        zip_file_path = __file__
-        while not zip_file_path.lower().endswith(".apworld"):
-            zip_file_path = os.path.dirname(zip_file_path)
-
-        # Set up temporary extraction directory
-        temp_base_dir = tempfile.gettempdir()
-        target_dir_path = os.path.join(temp_base_dir, "ttyd_temp_gclib")
-        temp_lib_path = os.path.join(target_dir_path, "ttyd", "lib", "gclib")
-
-        # Clean and recreate directory
-        if os.path.exists(target_dir_path):
-            import shutil
-            shutil.rmtree(target_dir_path)
-        os.makedirs(target_dir_path, exist_ok=True)
-
-        # Extract gclib files from .apworld zip
-        with zipfile.ZipFile(zip_file_path, "r") as zip_ref:
-            for member in zip_ref.namelist():
-                if "gclib" in member:
-                    zip_ref.extract(member, target_dir_path)
-
-        # Add lib directory to Python path for imports
-        lib_parent = os.path.join(target_dir_path, "ttyd", "lib")
-        if lib_parent not in sys.path:
-            sys.path.insert(0, lib_parent)
+_gclib_path = None
 
-        return temp_lib_path
-    else:
-        # For non-apworld case, add the lib directory to path
-        lib_parent = os.path.dirname(lib_path)
-        if lib_parent not in sys.path:
-            sys.path.insert(0, lib_parent)
-        return lib_path
+
+def find_apworld() -> Optional[str]:
+    """Path of the .apworld zip this module is imported from, or None when running from source."""
+    if ".apworld" not in __file__:
+        return None
+    zip_file_path = __file__
+    while not zip_file_path.lower().endswith(".apworld"):
+        zip_file_path = os.path.dirname(zip_file_path)
+    return zip_file_path
+
+
+def setup_gclib_path():
+    """Puts the bundled gclib on sys.path. From an .apworld it is imported straight out of the zip."""
+    global _gclib_path
+    if _gclib_path is not None:
+        return _gclib_path
+    # gclib is pure Python, so zipimport can load it from <apworld>/ttyd/lib just like a source checkout.
+    lib_parent = os.path.join(os.path.dirname(__file__), "lib")
+    if lib_parent not in sys.path:
+        sys.path.insert(0, lib_parent)
+    _gclib_path = os.path.join(lib_parent, "gclib")
+    return _gclib_path
 
 
 def _select_native_binary(pkg_dir: str) -> None:
     import platform
-    import shutil
     system = platform.system()
     if system == "Linux":
         src = "_abi3_linux_x86_64.so"
@@ -68,29 +56,43 @@ def _select_native_binary(pkg_dir: str) -> None:
         shutil.copyfile(src_path, dest_path)
 
 
-def setup_dme_path():
-    base_path = os.path.dirname(__file__)
-    lib_path = os.path.join(base_path, "lib")
+def _extract_dme(zip_file_path: str) -> str:
+    # The native module has to be on disk, so the package is extracted once per user into a cache
+    # directory named after the bundled files' names, CRCs and sizes (read from the zip directory, nothing
+    # is decompressed). Extraction goes to a staging directory that is renamed into place, so patchers
+    # and clients starting at the same time never see a half written copy; the loser discards its own.
+    with zipfile.ZipFile(zip_file_path, "r") as zip_ref:
+        members = [info for info in zip_ref.infolist() if "dolphin_memory_engine" in info.filename]
+        stamp = hashlib.sha256()
+        for info in members:
+            stamp.update(f"{info.filename}:{info.CRC:08x}:{info.file_size}\n".encode("utf-8"))
+        cache_dir = cache_path("ttyd", "dme")
+        target_dir_path = os.path.join(cache_dir, stamp.hexdigest()[:16])
+        lib_parent = os.path.join(target_dir_path, "ttyd", "lib")
+        if os.path.isdir(target_dir_path):
+            return lib_parent
+
+        os.makedirs(cache_dir, exist_ok=True)
+        staging_dir_path = tempfile.mkdtemp(prefix="staging_", dir=cache_dir)
+        for info in members:
+            zip_ref.extract(info, staging_dir_path)
+    _select_native_binary(os.path.join(staging_dir_path, "ttyd", "lib", "dolphin_memory_engine_ttyd"))
+    try:
+        os.rename(staging_dir_path, target_dir_path)
+    except OSError:
+        if not os.path.isdir(target_dir_path):
+            raise
+        shutil.rmtree(staging_dir_path, ignore_errors=True)
+    return lib_parent
 
-    if ".apworld" in __file__:
-        zip_file_path = __file__
-        while not zip_file_path.lower().endswith(".apworld"):
-            zip_file_path = os.path.dirname(zip_file_path)
 
-        target_dir_path = os.path.join(tempfile.gettempdir(), "ttyd_temp_dme")
-        lib_parent = os.path.join(target_dir_path, "ttyd", "lib")
-        marker = os.path.join(lib_parent, "dolphin_memory_engine_ttyd", "__init__.py")
-
-        if not os.path.exists(marker):
-            os.makedirs(target_dir_path, exist_ok=True)
-            with zipfile.ZipFile(zip_file_path, "r") as zip_ref:
-                for member in zip_ref.namelist():
-                    if "dolphin_memory_engine" in member:
-                        zip_ref.extract(member, target_dir_path)
+def setup_dme_path():
+    zip_file_path = find_apworld()
+    if zip_file_path is not None:
+        lib_parent = _extract_dme(zip_file_path)
     else:
-        lib_parent = lib_path
-
-    _select_native_binary(os.path.join(lib_parent, "dolphin_memory_engine_ttyd"))
+        lib_parent = os.path.join(os.path.dirname(__file__), "lib")
+        _select_native_binary(os.path.join(lib_parent, "dolphin_memory_engine_ttyd"))
 
     if lib_parent not in sys.path:
         sys.path.insert(0, lib_parent)
@@ -109,22 +111,44 @@ dolphin = None
 
 
 class TTYDPatcher:
-    rels: Dict[Rels, io.BytesIO] = {}
-
-    def __init__(self):
+    def __init__(self, base_hash: str, streaming: Optional[bool] = None, iso: Optional[StreamingGCM] = None,
+                 assets: Optional[PristineAssetCache] = None):
         setup_gclib_path()
         from gclib.gcm import GCM
         from gclib.dol import DOL
 
-        self.iso = GCM(get_settings().ttyd_options.rom_file)
-        self.iso.read_entire_disc()
+        options = get_settings().ttyd_options
+        if streaming is None:
+            streaming = bool(options.streaming_patch)
+        if iso is not None:
+            self.iso = iso
+        elif streaming:
+            self.iso = StreamingGCM(options.rom_file)
+        else:
+            self.iso = GCM(options.rom_file)
+            self.iso.read_entire_disc()
+        if assets is not None:
+            self.assets = assets
+        else:
+            self.assets = PristineAssetCache(cache_path("ttyd", "pristine"), iso_fingerprint(options.rom_file, base_hash))
         self.dol = DOL()
-        self.dol.read(self.iso.read_file_data("sys/main.dol"))
-        for rel in Rels:
-            if rel == Rels.dol:
-                continue
-            path = get_rel_path(rel)
-            self.rels[rel] = self.iso.read_file_data(path)
+        self.dol.read(io.BytesIO(self.read_pristine("sys/main.dol")))
+        # Rels are loaded on first use; only the ones in here are written back to the iso
+        self.rels: Dict[Rels, io.BytesIO] = {}
+
+    def get_rel(self, rel: Rels) -> io.BytesIO:
+        """The rel's data for patching, read from the iso the first time it is asked for."""
+        data = self.rels.get(rel)
+        if data is None:
+            data = self.rels[rel] = io.BytesIO(self.read_pristine(get_rel_path(rel)))
+        return data
+
+    def read_pristine(self, path: str) -> bytes:
+        return self.assets.get(path, lambda: self.iso.read_file_data(path).getvalue())
+
+    def close(self):
+        if isinstance(self.iso, StreamingGCM):
+            self.iso.close()
 
 
 def get_rel_path(rel: Rels):
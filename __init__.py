@@ -1,9 +1,8 @@
 import logging
-import os
 
 from Fill import fill_restrictive, fast_fill
-from typing import List, Dict, ClassVar, Any, Set
-from settings import UserFilePath, Group
+from typing import List, Dict, ClassVar, Any, Set, Union
+from settings import UserFilePath, Group, Bool
 from BaseClasses import Tutorial, ItemClassification, CollectionState, Item, Location
 from worlds.AutoWorld import WebWorld, World
 from .Data import starting_partners, stars, limit_pit, \
@@ -16,7 +15,7 @@ from .Options import Piecesanity, TTYDOptions, YoshiColor, StartingPartner, PitI
     DazzleRewards, StarShuffle, EnemyRandomizer
 from .Items import TTYDItem, itemList, item_table, ItemData, items_by_id
 from .Regions import create_regions, connect_regions, get_regions_dict, register_indirect_connections
-from .Rom import TTYDProcedurePatch, write_files
+from .Rom import snapshot_patch_data, write_patch
 from .Rules import set_rules, get_tattle_rules_dict, set_tattle_rules, get_random_enemy_tattle_rules_dict
 from worlds.LauncherComponents import Component, SuffixIdentifier, Type, components, launch_subprocess
 
@@ -65,9 +64,36 @@ class TTYDSettings(Group):
         copy_to = "Paper Mario - The Thousand-Year Door (USA).iso"
         description = "US TTYD .iso File"
 
+    class StreamingPatch(Bool):
+        """
+        Patch the iso by streaming it from disk instead of loading it through gclib.
+        Uses much less memory, only the files that get modified are held at once.
+        """
+
+    class OverlayOutput(Bool):
+        """
+        Write a small overlay of the changed files next to the patch instead of a full iso.
+        The client builds the iso from the base iso and the overlay the first time it launches Dolphin,
+        and reuses that iso on later launches as long as it still matches the patch.
+        Building it only avoids copying the whole base iso on Linux filesystems with reflink support
+        (Btrfs, XFS). Anywhere else, including NTFS and ext4, the first launch of each seed still
+        writes a full iso, and this option only defers that write from patching to launch.
+        Seeds generated with console_mode always produce a full iso.
+        """
+
+    class PatchCacheSize(int):
+        """
+        Maximum size in megabytes of the cache of patched isos, reused when the same patch is opened again.
+        Isos are only cached when they can be hard linked into the cache directory (same drive as the patch)
+        or reflinked, so the cache never writes a second copy of an iso. Set to 0 to disable the cache.
+        """
+
     dolphin_path: DolphinPath = DolphinPath(None)
     rom_file: RomFile = RomFile(RomFile.copy_to)
     rom_start: bool = True
+    streaming_patch: Union[StreamingPatch, bool] = False
+    overlay_output: Union[OverlayOutput, bool] = False
+    patch_cache_size: PatchCacheSize = PatchCacheSize(3000)
 
 
 class TTYDWorld(World):
@@ -98,6 +124,10 @@ class TTYDWorld(World):
     locked_item_frequencies: Dict[str, int]
     in_pre_fill: bool
     encounters: list[Encounter] = None
+    enemy_locations: Dict[int, List[int]]
+    tattle_rules: Dict[str, List[int]]
+    # Per-world enemy difficulty scores for the difficulty balanced shuffle; None scores by earliest chapter
+    enemy_scores: Dict[int, float] | None = None
     ut_can_gen_without_yaml = True
 
 
@@ -113,6 +143,7 @@ class TTYDWorld(World):
         self.limited_misc_locations = set()
         self.locked_item_frequencies = {}
         self.encounters = parse_json_encounters()
+        self.enemy_locations = {}
         # implementing yaml-less UT support
         if hasattr(self.multiworld, "re_gen_passthrough"):
             if self.game in self.multiworld.re_gen_passthrough:
@@ -133,6 +164,7 @@ class TTYDWorld(World):
                 self.options.shinesanity.value = slot_data["shinesanity"]
                 self.options.blue_pipe_toggle.value = slot_data["blue_pipe_toggle"]
                 self.options.enemy_randomizer.value = slot_data["enemy_randomizer"]
+                self.tattle_rules = slot_data.get("tattle_rules", get_tattle_rules_dict())
                 return
         if self.options.limit_chapter_eight and self.options.palace_skip:
             logging.warning(f"{self.player_name}'s has enabled both Palace Skip and Limit Chapter 8. "
@@ -173,16 +205,14 @@ class TTYDWorld(World):
         if self.options.tattlesanity and self.options.disable_intermissions:
             self.disabled_locations.update(["Tattle: Lord Crump"])
         if self.options.enemy_randomizer != EnemyRandomizer.option_vanilla:
-            randomize_encounters(self)
+            randomize_encounters(self, self.enemy_scores)
+            self.tattle_rules = get_random_enemy_tattle_rules_dict(self)
+        else:
+            self.tattle_rules = get_tattle_rules_dict()
         if self.options.tattlesanity:
             extra_disabled = [location.name for name, locations in get_regions_dict().items()
                               if name in self.excluded_regions for location in locations]
-            rules_dict = (
-                get_random_enemy_tattle_rules_dict(self)
-                if self.options.enemy_randomizer != EnemyRandomizer.option_vanilla
-                else get_tattle_rules_dict()
-            )
-            for location_name, locations in rules_dict.items():
+            for location_name, locations in self.tattle_rules.items():
                 if len(locations) == 0:
                     if "Palace of Shadow (Post-Riddle Tower)" in self.excluded_regions:
                         self.disabled_locations.update([location_name])
@@ -284,15 +314,7 @@ class TTYDWorld(World):
             for loc in locs
         }
 
-        base_rules = get_tattle_rules_dict()
-
-        rules_dict = (
-            get_random_enemy_tattle_rules_dict(self)
-            if self.options.enemy_randomizer != EnemyRandomizer.option_vanilla
-            else base_rules
-        )
-
-        for location_name, locations in rules_dict.items():
+        for location_name, locations in self.tattle_rules.items():
             if location_name in self.disabled_locations:
                 continue
 
@@ -451,9 +473,7 @@ class TTYDWorld(World):
             "shinesanity": self.options.shinesanity.value,
             "blue_pipe_toggle": self.options.blue_pipe_toggle.value,
             "enemy_randomizer": self.options.enemy_randomizer.value,
-            "tattle_rules": get_random_enemy_tattle_rules_dict(self)
-            if self.options.enemy_randomizer != EnemyRandomizer.option_vanilla
-            else get_tattle_rules_dict(),
+            "tattle_rules": self.tattle_rules,
             "multiplayer": self.options.multiplayer.value,
             "remote_items": self.options.remote_items.value,
         }
@@ -541,9 +561,5 @@ class TTYDWorld(World):
         return change
 
     def generate_output(self, output_directory: str) -> None:
-        patch = TTYDProcedurePatch(player=self.player, player_name=self.multiworld.player_name[self.player])
-        write_files(self, patch)
-        rom_path = os.path.join(
-            output_directory, f"{self.multiworld.get_out_file_name_base(self.player)}" f"{patch.patch_file_ending}"
-        )
-        patch.write(rom_path)
+        # Archipelago already calls this for each slot on its own output thread pool
+        write_patch(snapshot_patch_data(self), output_directory)
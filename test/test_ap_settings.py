@@ -0,0 +1,93 @@
+import io
+import random
+from unittest import TestCase
+
+from ..APSettings import AP_SETTINGS_LAYOUT, AP_SETTINGS_SIZE, AP_SETTINGS_START, pack_ap_settings, read_ap_settings
+
+# Offsets patch_mod wrote each setting to before the layout table, with the value's default
+_BYTE_SETTINGS = [
+    (0x220, "palace_stars", 7), (0x221, "starting_partner", 1), (0x222, "yoshi_color", 0),
+    (0x229, "palace_skip", 0), (0x22A, "westside", 0), (0x22B, "peekaboo", 0), (0x22C, "intermissions", 0),
+    (0x22D, "starting_hp", 10), (0x22E, "starting_fp", 5), (0x22F, "starting_bp", 3), (0x230, "full_run_bar", 0),
+    (0x238, "tattlesanity", 0), (0x239, "fast_travel", 0), (0x23A, "succeed_conditions", 0),
+    (0x23C, "cutscene_skip", 0), (0x23D, "experience_multiplier", 1), (0x23E, "starting_level", 1),
+    (0x241, "music", 0), (0x242, "block_visibility", 1), (0x243, "first_attack", 0), (0x248, "goal_stars", 7),
+    (0x249, "goal", 1), (0x24A, "star_shuffle", 1), (0x24B, "dazzle_rewards", 3), (0x24D, "shop_purchase_limit", 1),
+    (0x24E, "grubba_bribe_direction", 2), (0x24F, "grubba_bribe_cost", 20), (0x250, "blue_pipe_toggle", 1),
+    (0x251, "enemy_randomizer", 0), (0x252, "enemy_stat_scaling", 0), (0x253, "shuffle_chapter_stats", 0),
+    (0x258, "badge_bp", 0), (0x259, "badge_fp", 0), (0x25A, "partner_fp", 0),
+]
+
+_OLD_OFFSETS = {
+    "player_name_length": 0x1FF, "player_name": 0x200, "seed_name": 0x210, "ap_enabled": 0x223,
+    "yoshi_name_address": 0x224, "required_chapters": 0x231, "random_bytes": 0x244, "console_mode": 0x24C,
+    "yoshi_name": 0x260, **{key: offset for offset, key, _ in _BYTE_SETTINGS},
+}
+
+
+def _old_patch_mod(dol: io.BytesIO, seed_options: dict) -> None:
+    # The settings half of patch_mod as it was before the layout table, one seek and write per field
+    name_length = min(len(seed_options["player_name"]), 0x10)
+    rng = random.Random(seed_options["seed"] + seed_options["player"])
+    dol.seek(0x1FF)
+    dol.write(name_length.to_bytes(1, "big"))
+    dol.seek(0x200)
+    dol.write(seed_options["player_name"].encode("utf-8")[0:name_length])
+    dol.seek(0x210)
+    dol.write(seed_options["seed_name"].encode("utf-8")[0:16])
+    dol.seek(0x223)
+    dol.write((1).to_bytes(1, "big"))
+    dol.seek(0x224)
+    dol.write((0x80003260).to_bytes(4, "big"))
+    dol.seek(0x231)
+    for star in seed_options.get("required_chapters", []):
+        dol.write(star.to_bytes(1, "big"))
+    dol.seek(0x244)
+    dol.write(rng.randbytes(4))
+    dol.seek(0x24C)
+    dol.write((1 if seed_options.get("console_mode", 0) else 0).to_bytes(1, "big"))
+    for offset, key, default in _BYTE_SETTINGS:
+        dol.seek(offset)
+        dol.write(seed_options.get(key, default).to_bytes(1, "big"))
+    dol.seek(0x260)
+    dol.write(seed_options.get("yoshi_name", "Yoshi").encode("utf-8")[0:8] + b"\x00")
+
+
+def _seed_options(**overrides) -> dict:
+    options = {"seed": 123, "player": 2, "player_name": "Mario", "seed_name": "8675309",
+               "required_chapters": [2, 5, 7], "yoshi_name": "Pip", "console_mode": 3}
+    options.update({key: (offset * 7) % 200 for offset, key, _ in _BYTE_SETTINGS})
+    options.update(overrides)
+    return options
+
+
+class TestAPSettings(TestCase):
+    def test_offsets_match_old_writes(self) -> None:
+        self.assertEqual(_OLD_OFFSETS, {field.key: field.offset for field in AP_SETTINGS_LAYOUT})
+
+    def test_matches_old_patch_mod(self) -> None:
+        # A random background shows any byte the old writes left alone but the table overwrites
+        background = random.Random(0).randbytes(0x400)
+        for seed_options in (_seed_options(), _seed_options(player_name="A" * 20, seed_name="S" * 20,
+                                                            required_chapters=[], yoshi_name="LongYoshiName")):
+            old = io.BytesIO(background)
+            _old_patch_mod(old, seed_options)
+            new = bytearray(background)
+            pack_ap_settings(new, seed_options)
+            self.assertEqual(old.getvalue(), bytes(new))
+
+    def test_round_trip(self) -> None:
+        seed_options = _seed_options()
+        dol = bytearray(0x400)
+        pack_ap_settings(dol, seed_options)
+        values = read_ap_settings(bytes(dol[AP_SETTINGS_START:AP_SETTINGS_START + AP_SETTINGS_SIZE]))
+        for _, key, _ in _BYTE_SETTINGS:
+            self.assertEqual(seed_options[key], values[key], key)
+        self.assertEqual(5, values["player_name_length"])
+        self.assertEqual(b"Mario", values["player_name"].rstrip(b"\x00"))
+        self.assertEqual(b"8675309", values["seed_name"].rstrip(b"\x00"))
+        self.assertEqual(bytes([2, 5, 7]), values["required_chapters"].rstrip(b"\x00"))
+        self.assertEqual(b"Pip\x00", values["yoshi_name"][:4])
+        self.assertEqual(1, values["console_mode"])
+        self.assertEqual(1, values["ap_enabled"])
+        self.assertEqual(0x80003260, values["yoshi_name_address"])
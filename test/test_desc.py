@@ -0,0 +1,51 @@
+import io
+from unittest import TestCase
+
+from BaseClasses import ItemClassification
+from ..Rom import DESC_SIZE, SHOP_SLOTS, build_shop_descriptions, classification_to_color
+
+
+def _per_write_desc(entries) -> bytes:
+    # desc.txt as write_files used to build it, one buffer write per field
+    buffer = io.BytesIO()
+    for key, player_name, item_name, classification in entries:
+        buffer.write(key.encode("utf-8"))
+        buffer.write(b"\x00")
+        buffer.write(f"{player_name}'s\n<col {classification_to_color(classification)}ff>{item_name}</col>".encode("utf-8"))
+        buffer.write(b"\x00")
+    buffer.write(b"\x00")
+    desc_data = buffer.getvalue()
+    return desc_data + b"\x00" * (DESC_SIZE - len(desc_data))
+
+
+class TestShopDescriptions(TestCase):
+    def test_fitting_entries_are_padded(self) -> None:
+        classifications = [ItemClassification.progression, ItemClassification.useful,
+                           ItemClassification.trap, ItemClassification.filler]
+        entries = [(key, "Player", f"Item {i}", classifications[i % len(classifications)])
+                   for i, (key, _) in enumerate(SHOP_SLOTS)]
+        data = build_shop_descriptions(entries)
+        self.assertEqual(DESC_SIZE, len(data))
+        self.assertEqual(_per_write_desc(entries), data)
+
+    def test_long_names_are_shortened_to_fit(self) -> None:
+        # 16 character player names and escaped item names overflow desc.txt across every shop slot
+        entries = [(key, f"Player{i:02}" + "P" * 8, f"Item{i:02}" + "I" * 9 + "\\\\" + "I" * 7,
+                    ItemClassification.filler) for i, (key, _) in enumerate(SHOP_SLOTS)]
+        with self.assertLogs(level="WARNING"):
+            data = build_shop_descriptions(entries)
+        self.assertEqual(DESC_SIZE, len(data))
+        fields = data.rstrip(b"\x00").decode("utf-8").split("\x00")
+        self.assertEqual([key for key, _, _, _ in entries], fields[0::2])
+        for (_, player_name, item_name, _), text in zip(entries, fields[1::2]):
+            shown_player, shown_item = text.split("'s\n<col ")
+            self.assertTrue(player_name.startswith(shown_player))
+            shown_item = shown_item[len("000000ff>"):-len("</col>")]
+            self.assertTrue(item_name.startswith(shown_item))
+            # An escaped backslash is kept whole or dropped whole
+            self.assertEqual(0, (len(shown_item) - len(shown_item.rstrip("\\"))) % 2)
+
+    def test_unfittable_entries_raise(self) -> None:
+        entries = [(key * 8, "", "", ItemClassification.filler) for key, _ in SHOP_SLOTS]
+        with self.assertRaisesRegex(Exception, "reserved for desc.txt"):
+            build_shop_descriptions(entries)
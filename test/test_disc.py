@@ -0,0 +1,165 @@
+import io
+import os
+import struct
+import tempfile
+from unittest import TestCase, mock
+
+from .. import Disc
+from ..Disc import (RELOCATION_ALIGNMENT, StreamingGCM, apply_overlay, build_manifest, overlay_path_for,
+                    verify_disc)
+
+_DISC_SIZE = 0x100000
+_DOL_OFFSET = 0x3000
+_FST_OFFSET = 0x8000
+_REL_OFFSET = 0x10000
+_ICON_OFFSET = 0x20000
+
+
+def _build_disc(path: str) -> bytes:
+    """A minimal GameCube image: boot.bin, an apploader header, a one-section DOL and files/rel/a.rel, files/icon.bin."""
+    image = bytearray(0xC0000)
+    struct.pack_into(">II", image, 0x2454, 0x100, 0)
+    struct.pack_into(">I", image, _DOL_OFFSET, 0x100)
+    struct.pack_into(">I", image, _DOL_OFFSET + 0x90, 0x200)
+    image[_DOL_OFFSET + 0x100:_DOL_OFFSET + 0x300] = b"D" * 0x200
+    # Sorted the way the FST is rebuilt, so an unchanged disc exports byte for byte
+    names = b"icon.bin\x00rel\x00a.rel\x00"
+    entries = [(0x01000000, 0, 4), (0, _ICON_OFFSET, 0x80), (0x01000000 | 9, 0, 4), (13, _REL_OFFSET, 0x100)]
+    fst = b"".join(struct.pack(">III", *entry) for entry in entries) + names
+    image[_FST_OFFSET:_FST_OFFSET + len(fst)] = fst
+    struct.pack_into(">IIII", image, 0x420, _DOL_OFFSET, _FST_OFFSET, len(fst), len(fst))
+    image[_REL_OFFSET:_REL_OFFSET + 0x100] = b"A" * 0x100
+    image[_ICON_OFFSET:_ICON_OFFSET + 0x80] = b"I" * 0x80
+    with open(path, "wb") as f:
+        f.write(image)
+    return bytes(image)
+
+
+class TestStreamingGCM(TestCase):
+    def setUp(self) -> None:
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.directory = temp.name
+        disc_size = mock.patch.object(Disc, "GCM_DISC_SIZE", _DISC_SIZE)
+        disc_size.start()
+        self.addCleanup(disc_size.stop)
+        self.base_path = os.path.join(self.directory, "base.iso")
+        self.base = _build_disc(self.base_path)
+
+    def _export(self, change, name: str = "out.iso") -> StreamingGCM:
+        iso = StreamingGCM(self.base_path)
+        self.addCleanup(iso.close)
+        change(iso)
+        for _ in iso.export_disc_to_iso_with_changed_files(os.path.join(self.directory, name)):
+            continue
+        patched = StreamingGCM(os.path.join(self.directory, name))
+        self.addCleanup(patched.close)
+        return patched
+
+    def _read(self, iso: StreamingGCM, path: str) -> bytes:
+        return iso.read_file_data(path).getvalue()
+
+    def test_copy_fallbacks_match(self) -> None:
+        copies = {
+            "reflink": (Disc.reflink, Disc._kernel_copies),
+            "kernel": (lambda source_fd, output_fd: False, Disc._kernel_copies),
+            "write": (lambda source_fd, output_fd: False, lambda: []),
+        }
+        for name, (reflink, kernel_copies) in copies.items():
+            with mock.patch.object(Disc, "reflink", reflink), mock.patch.object(Disc, "_kernel_copies", kernel_copies):
+                self._export(lambda iso: None, f"{name}.iso")
+            with open(os.path.join(self.directory, f"{name}.iso"), "rb") as f:
+                data = f.read()
+            # The FST and the boot.bin fields pointing at it are rewritten with the same values
+            self.assertEqual(self.base, data, name)
+
+    def test_in_place(self) -> None:
+        def change(iso: StreamingGCM) -> None:
+            iso.changed_files["files/icon.bin"] = io.BytesIO(b"J" * 0x80)
+            dol = iso.read_file_data("sys/main.dol")
+            dol.seek(0x100)
+            dol.write(b"XXXX")
+            iso.changed_files["sys/main.dol"] = dol
+
+        patched = self._export(change)
+        self.assertEqual((_ICON_OFFSET, 0x80), patched.files["files/icon.bin"])
+        self.assertEqual(b"J" * 0x80, self._read(patched, "files/icon.bin"))
+        self.assertEqual(_DOL_OFFSET, patched.dol_offset)
+        self.assertEqual(b"XXXX" + b"D" * 0x1FC, self._read(patched, "sys/main.dol")[0x100:])
+        self.assertEqual(b"A" * 0x100, self._read(patched, "files/rel/a.rel"))
+
+    def test_shrunk(self) -> None:
+        patched = self._export(lambda iso: iso.changed_files.__setitem__("files/icon.bin", io.BytesIO(b"J" * 0x40)))
+        self.assertEqual((_ICON_OFFSET, 0x40), patched.files["files/icon.bin"])
+        self.assertEqual(b"J" * 0x40, self._read(patched, "files/icon.bin"))
+
+    def test_grown_file_moves(self) -> None:
+        # Too big to stay put: it would run into icon.bin
+        grown = b"B" * (_ICON_OFFSET - _REL_OFFSET + 0x100)
+        patched = self._export(lambda iso: iso.changed_files.__setitem__("files/rel/a.rel", io.BytesIO(grown)))
+        offset, size = patched.files["files/rel/a.rel"]
+        self.assertEqual(len(grown), size)
+        self.assertNotEqual(_REL_OFFSET, offset)
+        self.assertEqual(0, offset % RELOCATION_ALIGNMENT)
+        self.assertEqual(grown, self._read(patched, "files/rel/a.rel"))
+        # Nothing else on the disc overlaps the new extent
+        self.assertTrue(offset >= _ICON_OFFSET + 0x80 or offset + size <= _ICON_OFFSET)
+        self.assertEqual(b"I" * 0x80, self._read(patched, "files/icon.bin"))
+
+    def test_new_directory(self) -> None:
+        def change(iso: StreamingGCM) -> None:
+            iso.add_new_directory("files/mod")
+            iso.add_new_file("files/mod/mod.rel", io.BytesIO(b"M" * 0x1000))
+
+        patched = self._export(change)
+        self.assertIn("files/mod", patched.directories)
+        self.assertEqual(b"M" * 0x1000, self._read(patched, "files/mod/mod.rel"))
+        # The FST outgrew its reserved space, so it was placed elsewhere and boot.bin points at it
+        self.assertNotEqual(_FST_OFFSET, patched.fst_offset)
+        self.assertEqual(b"A" * 0x100, self._read(patched, "files/rel/a.rel"))
+        self.assertEqual(b"I" * 0x80, self._read(patched, "files/icon.bin"))
+
+    def test_add_rejects_missing_parent(self) -> None:
+        iso = StreamingGCM(self.base_path)
+        self.addCleanup(iso.close)
+        with self.assertRaises(Exception):
+            iso.add_new_file("files/mod/mod.rel")
+        with self.assertRaises(Exception):
+            iso.add_new_directory("files/rel")
+
+    def _change_everything(self, iso: StreamingGCM) -> None:
+        iso.changed_files["files/icon.bin"] = io.BytesIO(b"J" * 0x40)
+        iso.changed_files["files/rel/a.rel"] = io.BytesIO(b"B" * 0x300)
+        iso.add_new_directory("files/mod")
+        iso.add_new_file("files/mod/mod.rel", io.BytesIO(b"M" * 0x1000))
+
+    def test_overlay_matches_full_export(self) -> None:
+        self._export(self._change_everything, "full.iso")
+        iso = StreamingGCM(self.base_path)
+        self.addCleanup(iso.close)
+        self._change_everything(iso)
+        manifest = build_manifest(iso.changed_files)
+        overlay = overlay_path_for(os.path.join(self.directory, "overlay.iso"))
+        for _ in iso.export_overlay(overlay):
+            continue
+        rebuilt = os.path.join(self.directory, "overlay.iso")
+        for _ in apply_overlay(self.base_path, overlay, rebuilt):
+            continue
+        with open(os.path.join(self.directory, "full.iso"), "rb") as full, open(rebuilt, "rb") as f:
+            self.assertEqual(full.read(), f.read())
+        self.assertEqual([], verify_disc(rebuilt, manifest))
+        self.assertEqual(sorted(manifest["files"]), sorted(verify_disc(self.base_path, manifest)))
+
+    def test_overlay_rejects_other_base(self) -> None:
+        iso = StreamingGCM(self.base_path)
+        self.addCleanup(iso.close)
+        self._change_everything(iso)
+        overlay = os.path.join(self.directory, "out.ttydov")
+        for _ in iso.export_overlay(overlay):
+            continue
+        other = os.path.join(self.directory, "other.iso")
+        with open(other, "wb") as f:
+            f.write(self.base[:_FST_OFFSET] + b"\xff" + self.base[_FST_OFFSET + 1:])
+        with self.assertRaises(Exception):
+            for _ in apply_overlay(other, overlay, os.path.join(self.directory, "rebuilt.iso")):
+                continue
@@ -0,0 +1,39 @@
+import struct
+from collections import defaultdict
+from unittest import TestCase
+
+from ..Enemy import (Encounter, ENEMIES_BIN_MAGIC, MAX_GROUP_SIZE, pack_encounters_v1, pack_encounters_v2,
+                     parse_json_encounters, unpack_encounters)
+
+
+class TestEnemiesBin(TestCase):
+    def setUp(self) -> None:
+        self.encounters = parse_json_encounters()
+
+    def test_v1_round_trip(self) -> None:
+        groups = unpack_encounters(pack_encounters_v1(self.encounters))
+        self.assertEqual([(None, list(encounter.enemy_ids)) for encounter in self.encounters],
+                         [(rel, list(ids)) for rel, ids in groups])
+
+    def test_v2_round_trip(self) -> None:
+        # v2 groups come back rel by rel, in the order each rel first appears, keeping their order within it
+        by_rel = defaultdict(list)
+        for encounter in self.encounters:
+            by_rel[encounter.rel].append((encounter.rel, list(encounter.enemy_ids)))
+        expected = [group for groups in by_rel.values() for group in groups]
+        groups = unpack_encounters(pack_encounters_v2(self.encounters))
+        self.assertEqual(expected, [(rel, list(ids)) for rel, ids in groups])
+
+    def test_v2_rejects_other_versions(self) -> None:
+        data = bytearray(pack_encounters_v2(self.encounters))
+        data[len(ENEMIES_BIN_MAGIC)] += 1
+        with self.assertRaises(ValueError):
+            unpack_encounters(bytes(data))
+
+    def test_v2_rejects_oversized_groups(self) -> None:
+        encounter = Encounter("Too Many", "gor", None, MAX_GROUP_SIZE + 1, range(1, MAX_GROUP_SIZE + 2))
+        with self.assertRaises(ValueError):
+            pack_encounters_v2([encounter])
+
+    def test_v1_header_counts_groups(self) -> None:
+        self.assertEqual(len(self.encounters), struct.unpack_from(">H", pack_encounters_v1(self.encounters))[0])
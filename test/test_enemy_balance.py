@@ -0,0 +1,38 @@
+import random
+from collections import Counter
+from types import SimpleNamespace
+from unittest import TestCase
+
+from ..Enemy import default_enemy_scores, parse_json_encounters, randomize_encounters
+from ..Options import EnemyRandomizer, EncounterShuffleType
+
+
+def _world(seed: int, enemy_randomizer: int) -> SimpleNamespace:
+    options = SimpleNamespace(
+        encounter_shuffle_type=SimpleNamespace(value=EncounterShuffleType.option_difficulty_balanced),
+        enemy_randomizer=enemy_randomizer)
+    return SimpleNamespace(options=options, random=random.Random(seed), encounters=parse_json_encounters())
+
+
+class TestEnemyBalance(TestCase):
+    def test_every_group_placed_once(self) -> None:
+        for enemy_randomizer in (EnemyRandomizer.option_within_chapter, EnemyRandomizer.option_randomize):
+            original = Counter(tuple(sorted(encounter.enemy_ids)) for encounter in parse_json_encounters())
+            world = _world(0, enemy_randomizer)
+            randomize_encounters(world)
+            self.assertEqual(original, Counter(tuple(sorted(encounter.enemy_ids)) for encounter in world.encounters))
+
+    def test_scores_are_per_world(self) -> None:
+        # Inverting the default scores must change the result for that world only
+        default_world = _world(1, EnemyRandomizer.option_randomize)
+        randomize_encounters(default_world)
+        scores = default_enemy_scores(parse_json_encounters())
+        inverted = {enemy: -score for enemy, score in scores.items()}
+        inverted_world = _world(1, EnemyRandomizer.option_randomize)
+        randomize_encounters(inverted_world, inverted)
+        again_world = _world(1, EnemyRandomizer.option_randomize)
+        randomize_encounters(again_world)
+        self.assertNotEqual([list(e.enemy_ids) for e in default_world.encounters],
+                            [list(e.enemy_ids) for e in inverted_world.encounters])
+        self.assertEqual([list(e.enemy_ids) for e in default_world.encounters],
+                         [list(e.enemy_ids) for e in again_world.encounters])
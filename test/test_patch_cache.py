@@ -0,0 +1,41 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from ..PatchCache import PatchedIsoCache
+
+
+class TestPatchedIsoCache(TestCase):
+    def setUp(self) -> None:
+        self.temp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp.cleanup)
+        self.cache = PatchedIsoCache(os.path.join(self.temp.name, "cache"), 0x1000)
+        self.output = os.path.join(self.temp.name, "out.iso")
+        with open(self.output, "wb") as f:
+            f.write(b"\x01" * 0x400)
+
+    def test_store_links_and_fetch_returns_entry(self) -> None:
+        self.cache.store("key", self.output)
+        self.assertTrue(os.path.samefile(self.output, self.cache.entry_path("key")))
+        target = os.path.join(self.temp.name, "again.iso")
+        self.assertTrue(self.cache.fetch("key", target))
+        with open(target, "rb") as f:
+            self.assertEqual(b"\x01" * 0x400, f.read())
+
+    def test_store_skips_when_it_would_copy(self) -> None:
+        # e.g. the output on another drive than the cache: no hard link, no reflink
+        with mock.patch("os.link", side_effect=OSError), \
+                mock.patch(f"{PatchedIsoCache.__module__}.reflink", return_value=False):
+            self.cache.store("key", self.output)
+        self.assertFalse(os.path.exists(self.cache.entry_path("key")))
+        self.assertEqual([], [name for name in os.listdir(self.cache.directory) if name.endswith(".tmp")])
+
+    def test_evict_counts_stale_staging_files(self) -> None:
+        os.makedirs(self.cache.directory)
+        stale = os.path.join(self.cache.directory, "old.iso.1.2.tmp")
+        with open(stale, "wb") as f:
+            f.write(bytes(0xD00))
+        os.utime(stale, (0, 0))
+        self.cache.store("key", self.output)
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(self.cache.entry_path("key")))
@@ -0,0 +1,20 @@
+import json
+from unittest import TestCase
+
+from ..PatchOptions import PatchOptions, load_patch_options
+
+
+class TestPatchOptions(TestCase):
+    def test_round_trip(self) -> None:
+        options = PatchOptions(seed=5, player_name="Mario", required_chapters=(2, 4, 7))
+        self.assertEqual(options, load_patch_options(options.encode()))
+
+    def test_hashable(self) -> None:
+        options = load_patch_options(PatchOptions(required_chapters=(1, 3)).encode())
+        self.assertIsInstance(options.required_chapters, tuple)
+        self.assertEqual(hash(options), hash(PatchOptions(required_chapters=(1, 3))))
+
+    def test_missing_keys_take_defaults(self) -> None:
+        # Unversioned patches from before options_version may leave keys out
+        options = load_patch_options(json.dumps({"seed": 3, "required_chapters": [6]}).encode("utf-8"))
+        self.assertEqual(PatchOptions(seed=3, required_chapters=(6,)), options)
@@ -0,0 +1,57 @@
+import tempfile
+import zipfile
+from types import SimpleNamespace
+from unittest import TestCase
+
+from ..Enemy import parse_json_encounters
+from ..Items import items_by_id
+from ..Locations import all_locations
+from ..Rom import snapshot_patch_data, write_files, write_patch
+
+
+class _Options:
+    def __getattr__(self, name: str) -> SimpleNamespace:
+        return SimpleNamespace(value="Yoshi" if name == "yoshi_name" else 0)
+
+
+def _world(player: int, multiworld: SimpleNamespace) -> SimpleNamespace:
+    return SimpleNamespace(player=player, options=_Options(), multiworld=multiworld,
+                           required_chapters=[player, player + 2], encounters=parse_json_encounters())
+
+
+def _multiworld() -> SimpleNamespace:
+    items = [item for item in items_by_id.values() if item.id is not None]
+    locations = {1: [], 2: []}
+    for n, data in enumerate(location for location in all_locations if location.id):
+        for player, slot in locations.items():
+            item = items[(n + player) % len(items)]
+            placed = SimpleNamespace(name=item.item_name, code=item.id, player=(n + player) % 2 + 1,
+                                     classification=item.progression)
+            slot.append(SimpleNamespace(name=data.name, address=data.id, item=placed))
+    return SimpleNamespace(seed=1, seed_name="12345", player_name={1: "Mario", 2: "Luigi"},
+                           get_locations=locations.__getitem__,
+                           get_out_file_name_base=lambda player: f"AP_12345_P{player}")
+
+
+class TestPatchOutput(TestCase):
+    def test_write_patch_matches_write_files(self) -> None:
+        multiworld = _multiworld()
+        worlds = [_world(1, multiworld), _world(2, multiworld)]
+        with tempfile.TemporaryDirectory() as output_directory:
+            paths = [write_patch(snapshot_patch_data(world), output_directory) for world in worlds]
+            self.assertEqual(2, len(set(paths)))
+            for world, path in zip(worlds, paths):
+                expected = {}
+                write_files(world, SimpleNamespace(write_file=expected.__setitem__))
+                with zipfile.ZipFile(path) as zf:
+                    for name, data in expected.items():
+                        self.assertEqual(data, zf.read(name), (path, name))
+
+    def test_snapshot_is_detached_from_the_world(self) -> None:
+        # generate_output may run on an output thread after the world moves on
+        world = _world(1, _multiworld())
+        snapshot = snapshot_patch_data(world)
+        world.required_chapters.append(7)
+        world.encounters.clear()
+        self.assertEqual((1, 3), snapshot.options.required_chapters)
+        self.assertTrue(snapshot.encounters)
@@ -0,0 +1,93 @@
+import io
+import json
+from types import SimpleNamespace
+from unittest import TestCase
+
+from ..Data import Rels, location_to_unit, shop_items
+from ..Items import ItemData, items_by_id
+from ..Locations import all_locations, location_table, locationName_to_data
+from ..PatchOptions import PatchOptions
+from ..Rom import TTYDPatchExtension, _is_infinitely_repurchasable, build_write_plan, pack_locations
+
+
+def _placements() -> dict:
+    """location name -> (item code, item player, shop price) for a two player seed, in location order."""
+    items = [item for item in items_by_id.values() if item.id is not None]
+    return {data.name: (items[n % len(items)].id, 1 if n % 3 else 2, (n * 7) % 100 + 1)
+            for n, data in enumerate(location for location in all_locations if location.id)}
+
+
+def _rel_sizes() -> dict:
+    sizes = {Rels.dol: 0xB00 + 2 * max(unit for units in location_to_unit.values() for unit in units) + 2}
+    for data in locationName_to_data.values():
+        for offset in data.offset or ():
+            sizes[data.rel] = max(sizes.get(data.rel, 0), offset + 8)
+    sizes[Rels.pik] = max(sizes.get(Rels.pik, 0), max(sizes.values()))
+    return sizes
+
+
+def _legacy_patch_items(placements: dict, player: int, remote_items: int, limit_mode: int) -> dict:
+    # patch_items as it was before the write plan, one seek and write per location
+    rels = {rel: io.BytesIO(bytes(size)) for rel, size in _rel_sizes().items()}
+    for location_name, (item_id, item_player, shop_price) in placements.items():
+        data = locationName_to_data.get(location_name, None)
+        if data is None or not (data.offset or "Tattle" in location_name):
+            continue
+        if item_player != player:
+            rom_id = 0x71
+        else:
+            item_data = items_by_id.get(item_id, ItemData(id=0, item_name="", progression="filler", rom_id=0x0))
+            rom_id = item_data.rom_id
+            if remote_items == 1 and rom_id != 0:
+                repurchasable = data.id in shop_items and _is_infinitely_repurchasable(
+                    rom_id, limit_mode, item_data.progression)
+                if not repurchasable:
+                    rom_id = 0x71
+        if data.rel == Rels.dol:
+            if "Tattle" in location_name:
+                for unit_id in location_to_unit[location_table[location_name]]:
+                    rels[Rels.dol].seek(0xB00 + ((unit_id - 1) * 2))
+                    rels[Rels.dol].write(rom_id.to_bytes(2, "big"))
+            elif "Dazzle" in location_name:
+                rels[Rels.dol].seek(data.offset[0])
+                rels[Rels.dol].write(rom_id.to_bytes(2, "big"))
+            continue
+        for i, offset in enumerate(data.offset):
+            if "30 Coins" in data.name and i == 1:
+                rels[Rels.pik].seek(offset)
+                rels[Rels.pik].write(rom_id.to_bytes(4, "big"))
+                continue
+            rels[data.rel].seek(offset)
+            rels[data.rel].write(rom_id.to_bytes(4, "big"))
+            if data.id in shop_items:
+                rels[data.rel].seek(offset + 4)
+                rels[data.rel].write(int.to_bytes(20 if rom_id == 0x71 else shop_price, 4, "big"))
+    return {rel: data.getvalue() for rel, data in rels.items()}
+
+
+def _patch_items(files: dict, player: int, options: PatchOptions) -> dict:
+    rels = {rel: io.BytesIO(bytes(size)) for rel, size in _rel_sizes().items()}
+    patcher = SimpleNamespace(dol=SimpleNamespace(data=rels[Rels.dol]), get_rel=rels.__getitem__)
+    caller = SimpleNamespace(files=files, get_file=files.__getitem__, player=player, options=options, patcher=patcher)
+    TTYDPatchExtension.patch_items(caller)
+    return {rel: data.getvalue() for rel, data in rels.items()}
+
+
+class TestWritePlan(TestCase):
+    def test_matches_legacy_patch_items(self) -> None:
+        placements = _placements()
+        records = [(locationName_to_data[name].id, item_id, item_player, shop_price)
+                   for name, (item_id, item_player, shop_price) in placements.items()]
+        for remote_items in (0, 1):
+            for limit_mode in (0, 1, 2):
+                options = PatchOptions(player=1, remote_items=remote_items, shop_purchase_limit=limit_mode)
+                expected = _legacy_patch_items(placements, 1, remote_items, limit_mode)
+                plan = build_write_plan(records, 1, remote_items == 1, limit_mode, lambda message: None)
+                sources = {
+                    "writes.bin": {"writes.bin": plan},
+                    "locations.bin": {"locations.bin": pack_locations(records)},
+                    "locations.json": {"locations.json": json.dumps(placements).encode("utf-8")},
+                }
+                for name, files in sources.items():
+                    with self.subTest(source=name, remote_items=remote_items, limit_mode=limit_mode):
+                        self.assertEqual(expected, _patch_items(files, 1, options))
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""Build a patched iso from the base iso and a .ttydov overlay.
+
+Overlays are written instead of full isos when overlay_output is enabled in
+host.yaml. The client applies them automatically before launching Dolphin;
+this does the same by hand:
+
+    python -m worlds.ttyd.tools.apply_overlay AP_seed_P1.ttydov [output.iso] [--rom base.iso]
+"""
+import argparse
+import os
+import sys
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description="Apply a TTYD overlay to the base iso.")
+    parser.add_argument("overlay", help="path to a .ttydov file")
+    parser.add_argument("output", nargs="?", help="iso to write, defaults to the overlay path with .iso")
+    parser.add_argument("--rom", help="base iso, defaults to ttyd_options.rom_file from host.yaml")
+    args = parser.parse_args(argv)
+
+    from settings import get_settings
+    from ..Disc import apply_overlay
+    from ..PatchCache import remove_output
+
+    rom_file = args.rom or get_settings().ttyd_options.rom_file
+    output = args.output or os.path.splitext(args.overlay)[0] + ".iso"
+    remove_output(output)
+    for _ in apply_overlay(rom_file, args.overlay, output):
+        continue
+    print(f"Wrote {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
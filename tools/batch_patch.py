@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Patch many .apttyd files into isos in parallel.
+
+The base iso is read once: its DOL and rels are placed in a shared memory
+block that every worker maps read-only, and each worker memory-maps the disc
+once and reuses the parsed FST for every patch it handles. Outputs are always
+written in streaming mode and bypass the patched iso cache.
+
+Run it from the Archipelago root, with the base iso from host.yaml or --rom:
+
+    python -m worlds.ttyd.tools.batch_patch patches/*.apttyd --output-dir isos --jobs 4
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+_worker = {}
+
+
+class SharedAssets:
+    """Pristine files served from the shared memory block, anything else from the on-disk asset cache."""
+
+    def __init__(self, buffer, index: dict, fallback):
+        self.buffer = buffer
+        self.index = index
+        self.fallback = fallback
+
+    def get(self, name: str, produce) -> bytes:
+        if name in self.index:
+            offset, size = self.index[name]
+            return bytes(self.buffer[offset:offset + size])
+        return self.fallback.get(name, produce)
+
+    def derived(self, name: str, recipe: bytes, produce) -> bytes:
+        return self.fallback.derived(name, recipe, produce)
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before 3.13 attaching registers the block with this process's resource tracker on POSIX,
+        # which would unlink it when the worker exits. Windows has no tracker for shared memory.
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == "posix":
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def load_pristine(rom_file: str) -> tuple:
+    from Utils import cache_path
+    from ..Data import Rels
+    from ..Disc import StreamingGCM
+    from ..PatchCache import PristineAssetCache, iso_fingerprint, validate_base_iso
+    from ..Rom import TTYDProcedurePatch, get_verified_iso_cache
+    from ..TTYDPatcher import get_rel_path
+
+    # Checked once here so the workers all find the result cached instead of hashing the iso at the same time
+    validate_base_iso(rom_file, TTYDProcedurePatch.hash, get_verified_iso_cache())
+    fingerprint = iso_fingerprint(rom_file, TTYDProcedurePatch.hash)
+    assets = PristineAssetCache(cache_path("ttyd", "pristine"), fingerprint)
+    iso = StreamingGCM(rom_file)
+    try:
+        paths = ["sys/main.dol"] + [get_rel_path(rel) for rel in Rels if rel != Rels.dol]
+        files = {path: assets.get(path, lambda path=path: iso.read_file_data(path).getvalue()) for path in paths}
+    finally:
+        iso.close()
+    return fingerprint, files
+
+
+def init_worker(shm_name: str, index: dict, rom_file: str, fingerprint: str) -> None:
+    from Utils import cache_path
+    from ..Disc import StreamingGCM
+    from ..PatchCache import PristineAssetCache
+
+    shm = attach_shared_memory(shm_name)
+    _worker["shm"] = shm
+    _worker["iso"] = StreamingGCM(rom_file)
+    _worker["assets"] = SharedAssets(shm.buf, index,
+                                     PristineAssetCache(cache_path("ttyd", "pristine"), fingerprint))
+
+
+def patch_one(patch_path: str, output_dir: str) -> tuple:
+    from ..Rom import TTYDProcedurePatch
+
+    target = os.path.join(output_dir, os.path.splitext(os.path.basename(patch_path))[0] + TTYDProcedurePatch.result_file_ending)
+    start = time.perf_counter()
+    try:
+        patch = TTYDProcedurePatch(path=patch_path)
+        patch.base_iso = _worker["iso"]
+        patch.assets = _worker["assets"]
+        patch.use_cache = False
+        patch.patch(target)
+    except Exception as e:
+        return patch_path, target, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    # file_path is the overlay instead of the iso when overlay_output is on
+    return patch_path, patch.file_path, time.perf_counter() - start, None
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description="Patch many .apttyd files in parallel.")
+    parser.add_argument("patches", nargs="+", help=".apttyd files to patch")
+    parser.add_argument("--output-dir", default=".", help="directory for the patched isos")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--rom", help="base iso, defaults to ttyd_options.rom_file from host.yaml")
+    args = parser.parse_args(argv)
+
+    from settings import get_settings
+    from ..TTYDPatcher import setup_gclib_path
+
+    setup_gclib_path()
+    rom_file = args.rom or get_settings().ttyd_options.rom_file
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    fingerprint, files = load_pristine(rom_file)
+    shm = shared_memory.SharedMemory(create=True, size=sum(len(data) for data in files.values()))
+    try:
+        index = {}
+        offset = 0
+        for path, data in files.items():
+            shm.buf[offset:offset + len(data)] = data
+            index[path] = (offset, len(data))
+            offset += len(data)
+        del files
+        print(f"Loaded base iso into {shm.size / (1024 * 1024):.1f} MiB of shared memory "
+              f"in {time.perf_counter() - start:.2f}s")
+
+        failed = 0
+        written = 0
+        jobs = max(1, min(args.jobs, len(args.patches)))
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                 initargs=(shm.name, index, rom_file, fingerprint)) as pool:
+            futures = [pool.submit(patch_one, patch_path, args.output_dir) for patch_path in args.patches]
+            for future in as_completed(futures):
+                patch_path, target, seconds, error = future.result()
+                if error:
+                    failed += 1
+                    print(f"{seconds:8.2f}s  FAILED  {patch_path}: {error}")
+                else:
+                    written += os.path.getsize(target)
+                    print(f"{seconds:8.2f}s  {patch_path} -> {target}")
+    finally:
+        shm.close()
+        shm.unlink()
+
+    elapsed = time.perf_counter() - start
+    done = len(args.patches) - failed
+    print(f"{done}/{len(args.patches)} patched in {elapsed:.2f}s "
+          f"({done / elapsed * 60:.1f} isos/min, {written / elapsed / (1024 * 1024):.0f} MiB/s written)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Measure wall time and peak RSS of patching an .apttyd with each patch mode.
+
+Every run happens in a fresh child process so the peak RSS of one mode does
+not leak into the next. Each mode gets its own empty pristine asset cache, so
+its first run pays for the extraction and later runs show the warm cache. Run it from the Archipelago root with the iso set in
+host.yaml as usual:
+
+    python -m worlds.ttyd.tools.benchmark_patch AP_seed_P1.apttyd --runs 3
+
+Peak RSS comes from getrusage, so this only works on Linux and macOS.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ("gclib", "streaming")
+
+
+def patch_once(mode: str, patch_path: str, output_path: str, assets_dir: str) -> None:
+    from settings import get_settings
+    from ..PatchCache import PristineAssetCache, iso_fingerprint
+    from ..Rom import TTYDProcedurePatch
+
+    patch = TTYDProcedurePatch(path=patch_path)
+    patch.streaming = mode == "streaming"
+    # Sharing the user's asset cache would hand whichever mode runs second pre-decoded assets
+    patch.assets = PristineAssetCache(assets_dir, iso_fingerprint(get_settings().ttyd_options.rom_file, patch.hash))
+    # A patched iso cache hit would skip the work being measured
+    patch.use_cache = False
+    patch.patch(output_path)
+
+
+def peak_rss_mib(usage: resource.struct_rusage) -> float:
+    # ru_maxrss is in bytes on macOS and in KiB everywhere else.
+    scale = 1 if sys.platform == "darwin" else 1024
+    return usage.ru_maxrss * scale / (1024 * 1024)
+
+
+def run_child(mode: str, patch_path: str, output_path: str, assets_dir: str) -> tuple:
+    start = time.perf_counter()
+    pid = subprocess.Popen([sys.executable, "-m", __spec__.name, "--child", mode,
+                            patch_path, output_path, assets_dir]).pid
+    _, status, usage = os.wait4(pid, 0)
+    elapsed = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise SystemExit(f"{mode} patch failed")
+    return elapsed, peak_rss_mib(usage)
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark TTYD iso patching.")
+    parser.add_argument("patch", help="path to an .apttyd file")
+    parser.add_argument("output", nargs="?", help=argparse.SUPPRESS)
+    parser.add_argument("assets", nargs="?", help=argparse.SUPPRESS)
+    parser.add_argument("--runs", type=int, default=1, help="runs per mode")
+    parser.add_argument("--mode", choices=MODES, action="append", help="only benchmark these modes")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        patch_once(args.child, args.patch, args.output, args.assets)
+        return 0
+
+    print(f"{'mode':<12}{'run':>5}{'wall s':>10}{'peak RSS MiB':>15}")
+    from ..Disc import manifest_path_for, overlay_path_for
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_path = os.path.join(temp_dir, "patched.iso")
+        for mode in args.mode or MODES:
+            assets_dir = os.path.join(temp_dir, f"assets_{mode}")
+            for run in range(1, args.runs + 1):
+                elapsed, rss = run_child(mode, args.patch, output_path, assets_dir)
+                print(f"{mode:<12}{run:>5}{elapsed:>10.2f}{rss:>15.1f}")
+                # overlay_output writes an overlay instead of the iso
+                for path in (output_path, overlay_path_for(output_path), manifest_path_for(output_path)):
+                    if os.path.exists(path):
+                        os.remove(path)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""Print the item write plan stored in an .apttyd, one write per line.
+
+The output is stable and sorted by rel and offset, so two patches can be
+compared with a plain diff:
+
+    python -m worlds.ttyd.tools.dump_write_plan AP_seed_P1.apttyd > p1.txt
+
+Patches from before writes.bin have no plan; their writes are worked out
+from locations.bin the same way patching does.
+"""
+import argparse
+import sys
+import zipfile
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description="Dump the item write plan of an .apttyd.")
+    parser.add_argument("patch", help="path to an .apttyd file")
+    args = parser.parse_args(argv)
+
+    from ..PatchOptions import load_patch_options
+    from ..Rom import TTYDProcedurePatch, build_write_plan, read_write_plan, read_locations
+
+    with zipfile.ZipFile(args.patch) as zip_ref:
+        names = set(zip_ref.namelist())
+        if "writes.bin" in names:
+            plan = zip_ref.read("writes.bin")
+        else:
+            patch = TTYDProcedurePatch(path=args.patch)
+            patch.read()
+            options = load_patch_options(patch.get_file("options.json"))
+            plan = build_write_plan(read_locations(patch), patch.player, options.remote_items == 1,
+                                    options.shop_purchase_limit, print)
+
+    for rel, writes in sorted(read_write_plan(plan).items(), key=lambda item: item[0].value):
+        for offset, value in sorted(writes):
+            print(f"{rel.value:<5}{offset:#010x}  {value.hex()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
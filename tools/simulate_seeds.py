@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Batch logic simulator for TTYD option presets.
+
+Builds N single-player TTYD multiworlds in-process, runs the generation
+steps, fill and a beatability sweep on each, and reports throughput and
+failure rates per stage. Nothing is written to disk and no spoiler is
+produced, so it is safe to run on presets before handing them out.
+
+Run it from the Archipelago root so the world imports resolve:
+
+    python -m worlds.ttyd.tools.simulate_seeds --seeds 500 --jobs 8 \\
+        --option limit_chapter_logic=true --option limit_chapter_eight=true \\
+        --option keysanity=false --option tattlesanity=true
+
+Options can also come from a yaml file with --preset: a flat mapping of
+option name to value, or a player yaml without weighted values. Seeds
+are base_seed + i, split into contiguous per-worker ranges, so a failing
+seed can be rerun on its own with --base-seed <seed> --seeds 1.
+"""
+import argparse
+import logging
+import math
+import os
+import sys
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+STAGES = ("generate_early", "create_regions", "create_items", "set_rules", "connect_entrances",
+          "generate_basic", "pre_fill", "fill", "post_fill", "sweep")
+
+
+def load_preset(path: str) -> dict:
+    from Utils import parse_yaml
+    from .. import TTYDWorld
+
+    with open(path, encoding="utf-8-sig") as f:
+        data = parse_yaml(f.read()) or {}
+    return dict(data.get(TTYDWorld.game, data))
+
+
+def parse_option_args(values: list) -> dict:
+    options = {}
+    for value in values:
+        key, _, raw = value.partition("=")
+        options[key.strip()] = raw.strip()
+    return options
+
+
+def build_multiworld(seed: int, options: dict):
+    from argparse import Namespace
+    from BaseClasses import MultiWorld, CollectionState
+    from .. import TTYDWorld
+
+    multiworld = MultiWorld(1)
+    multiworld.game = {1: TTYDWorld.game}
+    multiworld.player_name = {1: "Simulator"}
+    multiworld.set_seed(seed)
+    args = Namespace()
+    for name, option in TTYDWorld.options_dataclass.type_hints.items():
+        setattr(args, name, {1: option.from_any(options.get(name, option.default))})
+    multiworld.set_options(args)
+    multiworld.set_item_links()
+    multiworld.state = CollectionState(multiworld)
+    return multiworld
+
+
+def simulate_seed(seed: int, options: dict) -> dict:
+    """Runs one seed through every stage. Stops at the first stage that raises or fails."""
+    from BaseClasses import CollectionState
+    from Fill import distribute_items_restrictive
+    from worlds.AutoWorld import call_all
+
+    timings = {}
+    stage = "setup"
+    try:
+        multiworld = build_multiworld(seed, options)
+        for stage in STAGES:
+            start = time.perf_counter()
+            if stage == "fill":
+                distribute_items_restrictive(multiworld)
+            elif stage == "sweep":
+                if not multiworld.can_beat_game(CollectionState(multiworld)):
+                    return {"seed": seed, "failed": stage, "error": "game is not beatable", "timings": timings}
+            else:
+                call_all(multiworld, stage)
+            timings[stage] = time.perf_counter() - start
+    except Exception as e:
+        return {"seed": seed, "failed": stage, "error": f"{type(e).__name__}: {e}",
+                "traceback": traceback.format_exc(), "timings": timings}
+    return {"seed": seed, "failed": None, "timings": timings}
+
+
+def simulate_range(seeds: range, options: dict) -> list:
+    logging.disable(logging.WARNING)
+    return [simulate_seed(seed, options) for seed in seeds]
+
+
+def partition(base_seed: int, count: int, jobs: int) -> list:
+    chunk = math.ceil(count / jobs) if count else 0
+    return [range(base_seed + start, base_seed + min(start + chunk, count))
+            for start in range(0, count, chunk or 1)]
+
+
+def report(results: list, elapsed: float, verbose: bool) -> None:
+    failures = Counter(result["failed"] for result in results if result["failed"])
+    totals = Counter()
+    counts = Counter()
+    for result in results:
+        for stage, seconds in result["timings"].items():
+            totals[stage] += seconds
+            counts[stage] += 1
+
+    print(f"{len(results)} seeds in {elapsed:.2f}s ({len(results) / elapsed:.2f} seeds/s)")
+    print(f"{'stage':<18}{'reached':>8}{'failed':>8}{'rate':>9}{'avg ms':>10}")
+    reached = len(results)
+    for stage in ("setup",) + STAGES:
+        failed = failures.get(stage, 0)
+        if stage != "setup" or failed:
+            avg = totals[stage] / counts[stage] * 1000 if counts[stage] else 0.0
+            rate = failed / reached * 100 if reached else 0.0
+            print(f"{stage:<18}{reached:>8}{failed:>8}{rate:>8.1f}%{avg:>10.1f}")
+        reached -= failed
+
+    failed_results = [result for result in results if result["failed"]]
+    for result in failed_results[:None if verbose else 10]:
+        print(f"seed {result['seed']}: {result['failed']}: {result['error']}")
+        if verbose and "traceback" in result:
+            print(result["traceback"])
+    if not verbose and len(failed_results) > 10:
+        print(f"... {len(failed_results) - 10} more, rerun with --verbose to list them all")
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description="Simulate TTYD generation over a batch of seeds.")
+    parser.add_argument("--seeds", type=int, default=100, help="number of seeds to simulate")
+    parser.add_argument("--base-seed", type=int, default=0, help="first seed, the rest follow consecutively")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--preset", help="yaml file with option values")
+    parser.add_argument("--option", action="append", default=[], metavar="NAME=VALUE",
+                        help="override a single option, may be repeated")
+    parser.add_argument("--verbose", action="store_true", help="print every failure with its traceback")
+    args = parser.parse_args(argv)
+
+    from .. import TTYDWorld
+
+    options = load_preset(args.preset) if args.preset else {}
+    options.update(parse_option_args(args.option))
+    unknown = sorted(set(options) - set(TTYDWorld.options_dataclass.type_hints))
+    if unknown:
+        print("unknown options:", ", ".join(unknown))
+        return 1
+
+    ranges = partition(args.base_seed, args.seeds, max(1, args.jobs))
+    start = time.perf_counter()
+    results = []
+    if args.jobs <= 1:
+        for seeds in ranges:
+            results += simulate_range(seeds, options)
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            for chunk in pool.map(simulate_range, ranges, [options] * len(ranges)):
+                results += chunk
+    elapsed = time.perf_counter() - start
+
+    report(results, elapsed, args.verbose)
+    return 1 if any(result["failed"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
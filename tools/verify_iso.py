@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""Check a patched iso against the manifest written next to it by the patcher.
+
+Only the files listed in the manifest (the DOL, patched rels, mod files,
+desc.txt, ...) are read, located through the iso's FST, so this takes a
+fraction of a second instead of hashing the whole disc:
+
+    python -m worlds.ttyd.tools.verify_iso AP_seed_P1.iso [--manifest AP_seed_P1.manifest.json]
+"""
+import argparse
+import sys
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description="Verify a patched TTYD iso against its manifest.")
+    parser.add_argument("iso", help="patched iso to check")
+    parser.add_argument("--manifest", help="manifest to check against, defaults to the iso path with .manifest.json")
+    args = parser.parse_args(argv)
+
+    from ..Disc import manifest_path_for, read_manifest, verify_disc
+
+    manifest = read_manifest(args.manifest or manifest_path_for(args.iso))
+    mismatched = verify_disc(args.iso, manifest)
+    for path in mismatched:
+        print(f"MISMATCH  {path}")
+    print(f"{len(manifest['files']) - len(mismatched)}/{len(manifest['files'])} files match "
+          f"(world version {manifest.get('world_version')}, base {manifest.get('base_hash')})")
+    return 1 if mismatched else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))